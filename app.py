@@ -1,7 +1,88 @@
+import hashlib
+import threading
 import streamlit as st
 import pandas as pd
-from io import BytesIO
-from datetime import datetime, timedelta
+import plotly.graph_objects as go
+from datetime import date, datetime
+
+from planner.capacity import (
+    BUCKET_DAYS,
+    DEFAULT_HORIZON_DAYS,
+    PROFILE_MEASURES,
+    build_load_profile,
+    heatmap_frame,
+)
+from planner.confidence import (
+    CONFIDENCE_LABELS,
+    COMMITMENT_LABEL,
+    DEFAULT_SCENARIOS,
+    client_confidence,
+    fit_line_factors,
+    order_confidence,
+    simulate_completion,
+)
+from planner.estimates import build_delivery_estimates
+from planner.export import EXCEL_MIME, create_excel_download, frame_content_hash
+from planner.ingestion import (
+    COLUMN_MAPPING_VERSION,
+    PLANT_COLUMN,
+    SUPPORTED_FORMATS,
+    read_production_file,
+    read_production_sources,
+)
+from planner.incremental import (
+    apply_delta,
+    build_incremental_state,
+    current_frame,
+    incremental_client_summary,
+    incremental_delivery_estimates,
+    incremental_line_summary,
+)
+from planner.instrumentation import (
+    RerunRecorder,
+    append_log,
+    perf_enabled,
+    perf_log_path,
+    profile_dir,
+)
+from planner.scheduling import DEFAULT_WORKING_HOURS, build_line_schedule, line_loads
+from planner.sequencing import optimize_sequence
+from planner.snapshots import (
+    diff_snapshots,
+    list_snapshots,
+    load_snapshot,
+    prune_snapshots,
+    save_snapshot,
+    snapshot_dir,
+    snapshot_keep_days,
+    snapshot_source,
+    store_version,
+)
+from planner.summaries import (
+    LINE_SUMMARY_DISPLAY_COLUMNS,
+    build_client_summary,
+    build_line_summary,
+    build_plant_summary,
+    find_bottlenecks,
+    plant_metrics,
+    plant_names,
+)
+from planner.whatif import (
+    PHASES,
+    SAFETY_BUFFER,
+    build_whatif_profile,
+    minutes_per_metre,
+    phase_lines,
+    quote_order,
+    quote_orders,
+    read_candidate_orders,
+)
+from planner.work_orders import (
+    build_work_orders,
+    line_display_frame,
+    line_overview,
+    page_bounds,
+)
 
 st.set_page_config(
     page_title="Pianificazione Produzione Tessile",
@@ -59,417 +140,978 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-COLUMN_MAPPING = {
-    1: 'ID_Cartellino',      # B: M25_NR_CARTELLINO
-    2: 'Cliente',            # C: EW2_COD_CLIFOR
-    3: 'Articolo',           # D: Z01_CD_ART
-    6: 'Linea',              # G: Linea
-    7: 'Macro_Fase',         # H: Macro_Fase
-    8: 'M24_QT_SALDO',       # I: M24_QT_SALDO
-    26: 'min_prd',           # Colonna 26: min_prd
-    38: 'ritardo_cartellino' # Colonna 38: ritardo cartellino.1
-}
-
-MIN_REQUIRED_COLUMNS = 39
-
-def get_priority_status(delay):
-    if delay > 10:
-        return "🔴 Critico"
-    elif delay > 5:
-        return "🟠 Alto"
-    elif delay > 0:
-        return "🟡 Medio"
+PARSE_CACHE_MAX_ENTRIES = 8
+EXPORT_CACHE_MAX_ENTRIES = 16
+PERF_HISTORY_RERUNS = 20
+
+# Righe mostrate per ciascun elenco del confronto tra snapshot (l'export le contiene tutte)
+DIFF_PREVIEW_ROWS = 1_000
+
+# Oltre questo numero di linee la scheda ordini parte dal riepilogo compatto
+COMPACT_VIEW_MIN_LINES = 20
+
+# Scenari selezionabili per le date di consegna con livello di confidenza
+SCENARIO_OPTIONS = [1_000, 5_000, DEFAULT_SCENARIOS]
+
+# Secondi a disposizione dell'ottimizzazione delle sequenze (per tutte le linee)
+SEQUENCE_BUDGET_OPTIONS = [1, 2, 5, 10, 30]
+
+# Orizzonti (giorni) del profilo di carico nel tempo
+HORIZON_OPTIONS = [30, 60, DEFAULT_HORIZON_DAYS, 180]
+
+# Scala colori della mappa di utilizzo: oltre il 200% le celle restano del colore massimo
+UTILIZATION_COLOR_MAX = 200
+
+# Strumentazione per stadio: senza PLANNER_PERF=1 i contesti non misurano nulla
+PERF_ENABLED = perf_enabled()
+perf = RerunRecorder(PERF_ENABLED)
+if PERF_ENABLED and st.session_state.pop('perf_profile_next', False):
+    perf.start_profile()
+
+@st.cache_data(max_entries=EXPORT_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_excel_export(content_hash, sheet_name, _df):
+    return create_excel_download(_df, sheet_name).getvalue()
+
+def lazy_excel_export(df, sheet_name):
+    # Il file viene generato solo al click sul pulsante di download, e una sola volta per contenuto
+    def generate():
+        if not PERF_ENABLED:
+            return _cached_excel_export(frame_content_hash(df), sheet_name, df)
+        # Il click arriva fuori dal rerun: l'export ha una propria riga nel log
+        export_perf = RerunRecorder(True)
+        with export_perf.stage(f"Export {sheet_name}", rows=len(df)):
+            data = _cached_excel_export(frame_content_hash(df), sheet_name, df)
+        append_log(export_perf.log_entry(kind='export'))
+        return data
+    return generate
+
+@st.cache_resource
+def get_parse_cache_stats():
+    # Condiviso tra tutte le sessioni: st.cache_resource restituisce sempre lo stesso oggetto
+    return {'hits': 0, 'misses': 0, 'lock': threading.Lock()}
+
+# Ogni sessione esegue lo script nel proprio thread: il flag indica se l'ultima
+# chiamata di questo thread ha dovuto rileggere il file
+_parse_call_state = threading.local()
+
+@st.cache_data(max_entries=PARSE_CACHE_MAX_ENTRIES, show_spinner="Lettura dei file in corso...")
+def _parse_upload(file_hash, mapping_version, file_names, _sources):
+    # Eseguita solo in caso di miss: la chiave e' (hash dei contenuti, versione del mapping),
+    # i byte dei file sono esclusi dall'hashing di Streamlit (prefisso "_")
+    _parse_call_state.missed = True
+    return read_production_sources(_sources)
+
+def uploads_hash(sources):
+    if len(sources) == 1:
+        return hashlib.sha256(sources[0][1]).hexdigest()
+    # Piu' file: l'ordine di caricamento non cambia il contenuto
+    digests = sorted(f"{name}:{hashlib.sha256(file_bytes).hexdigest()}" for name, file_bytes in sources)
+    return hashlib.sha256("\n".join(digests).encode()).hexdigest()
+
+def load_uploaded_files(uploaded_files):
+    sources = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    file_hash = uploads_hash(sources)
+    _parse_call_state.missed = False
+    result = _parse_upload(file_hash, COLUMN_MAPPING_VERSION, tuple(name for name, _ in sources), sources)
+    stats = get_parse_cache_stats()
+    with stats['lock']:
+        stats['misses' if _parse_call_state.missed else 'hits'] += 1
+    return file_hash, result
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_planning_model(file_hash, mapping_version, _df):
+    # Strutture derivate una volta per file e condivise in sola lettura tra le sessioni
+    schedule = build_line_schedule(_df)
+    return {
+        'schedule': schedule,
+        'queue_minutes': line_loads(schedule),
+        'whatif': build_whatif_profile(_df, schedule),
+        'work_orders': build_work_orders(_df),
+        'metrics': plant_metrics(_df),
+    }
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES, show_spinner="Ottimizzazione delle sequenze in corso...")
+def get_optimized_sequence(file_hash, mapping_version, time_budget, _df):
+    sequence = optimize_sequence(_df, time_budget)
+    sequence['work_orders'] = build_work_orders(_df, sequence['order'])
+    return sequence
+
+@st.cache_data(show_spinner="Calibrazione sui caricamenti salvati...")
+def get_line_factor_fit(snapshot_paths, snapshot_dates, snapshot_names, working_hours, source):
+    # Solo lo storico degli stessi stabilimenti del file aperto: linee omonime di altri
+    # stabilimenti non dicono nulla sulla resa di queste
+    snapshots = []
+    for path, snapshot_date, name in zip(snapshot_paths, snapshot_dates, snapshot_names):
+        frame = load_snapshot(path)
+        frame_source = snapshot_source(frame, name)
+        if frame_source == source:
+            snapshots.append((frame_source, snapshot_date, frame))
+    return fit_line_factors(snapshots, working_hours)
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES, show_spinner="Simulazione degli scenari di consegna...")
+def get_delivery_confidence(file_hash, mapping_version, scenarios, calibration, _df, _schedule):
+    # Simulazione in minuti di linea, indipendente dalle ore giornaliere: lo slider cambia solo la
+    # conversione in giorni. La calibrazione (snapshot usati e ore) fa parte della chiave
+    fitted = None
+    if calibration is not None:
+        fitted = get_line_factor_fit(*calibration)
+    return simulate_completion(_df, _schedule, scenarios, fitted)
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_load_profile(file_hash, mapping_version, plant, working_hours, horizon_days, bucket_days,
+                     reference_date, _df, _queue_minutes):
+    return build_load_profile(_df, _queue_minutes, working_hours, horizon_days, bucket_days, reference_date)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _cached_snapshot_list(store_dir, version):
+    # L'elenco apre lo schema di ogni file salvato: si rilegge solo quando la cartella cambia
+    return list_snapshots(store_dir)
+
+def saved_snapshot_list():
+    store_dir = snapshot_dir()
+    return _cached_snapshot_list(store_dir, store_version(store_dir))
+
+def confidence_calibration(df, working_hours):
+    # Stessa scelta per stime di consegna e simulazione nuovo ordine. La resa stimata confronta
+    # minuti smaltiti e capacita' del periodo, quindi dipende dalle ore giornaliere
+    if not st.session_state.get('confidence_calibrated', False):
+        return None
+    snapshots = saved_snapshot_list()
+    if len(snapshots) < 2:
+        return None
+    return (
+        tuple(snapshots['Percorso']), tuple(snapshots['Data']), tuple(snapshots['File']), working_hours,
+        snapshot_source(df, None)
+    )
+
+@st.cache_resource(show_spinner=False)
+def persist_snapshot(file_hash, mapping_version, snapshot_day, file_name, _df):
+    # Una scrittura per (contenuto, giorno): i rerun successivi trovano il risultato in cache
+    path = save_snapshot(_df, file_hash, file_name)
+    prune_snapshots()
+    return path
+
+@st.cache_data(max_entries=4, show_spinner="Confronto snapshot in corso...")
+def _cached_snapshot_diff(base_path, file_hash, _df):
+    return diff_snapshots(load_snapshot(base_path), _df)
+
+def record_perf_history(entry, scope):
+    history = st.session_state.setdefault('perf_history', [])
+    history.append({
+        'Ora': entry['timestamp'][11:19],
+        'Ambito': scope,
+        'Totale (s)': round(entry['total_seconds'], 3),
+        'Stadi': len(entry['stages']),
+        'RSS (MB)': None if entry['rss_mb'] is None else round(entry['rss_mb'], 1),
+    })
+    del history[:-PERF_HISTORY_RERUNS]
+
+def fragment_recorder():
+    # Nel rerun del solo frammento lo script principale non riparte: registro separato
+    return perf if not perf.finished else RerunRecorder(PERF_ENABLED)
+
+def close_fragment_recorder(recorder, fragment_name):
+    if recorder is perf or not recorder.enabled:
+        return
+    entry = recorder.log_entry(kind='fragment', fragment=fragment_name)
+    append_log(entry)
+    record_perf_history(entry, fragment_name)
+
+@st.fragment
+def render_work_orders_tab(df, file_hash, planning_model):
+    recorder = fragment_recorder()
+    st.markdown("### Ordini di Lavoro per Linea")
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        optimized = st.toggle(
+            "Sequenza ottimizzata",
+            help="Riordina ogni linea per ridurre il ritardo complessivo a fine lavorazione: "
+                 "tiene conto anche dei minuti di produzione, non solo del ritardo attuale"
+        )
+    with col2:
+        time_budget = st.selectbox(
+            "Tempo massimo (s)", options=SEQUENCE_BUDGET_OPTIONS, index=2, disabled=not optimized
+        )
+
+    if optimized:
+        with recorder.stage("Ottimizzazione sequenze", rows=len(df)):
+            sequence = get_optimized_sequence(file_hash, COLUMN_MAPPING_VERSION, time_budget, df)
+        work_orders_df, line_slices = sequence['work_orders']
+
+        current, improved = sequence['current_tardiness'], sequence['optimized_tardiness']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Ritardo Cumulato Attuale (gg)", f"{current:,.0f}")
+        with col2:
+            st.metric(
+                "Ritardo Cumulato Ottimizzato (gg)", f"{improved:,.0f}",
+                delta=f"{improved - current:,.0f}", delta_color="inverse"
+            )
+        with col3:
+            st.metric("Miglioramento", f"{100 * (1 - improved / current) if current > 0 else 0:.1f}%")
+        with st.expander("Dettaglio per linea", expanded=False):
+            st.dataframe(sequence['lines'], use_container_width=True, hide_index=True)
+            st.caption(
+                f"Ritardo cumulato: somma dei giorni di ritardo di ogni ordine alla fine stimata della lavorazione. "
+                f"Ottimizzazione in {sequence['seconds']:.1f} s su {sequence['workers']} processi."
+            )
+        st.markdown("*Sequenza ottimizzata per ridurre il ritardo cumulato*")
     else:
-        return "🟢 Normale"
-
-def get_priority_color(delay):
-    if delay > 10:
-        return "#dc3545"
-    elif delay > 5:
-        return "#fd7e14"
-    elif delay > 0:
-        return "#ffc107"
+        work_orders_df, line_slices = planning_model['work_orders']
+        st.markdown("*Ordinati per ritardo (priorità decrescente)*")
+
+    VISTA_COMPATTA = "Riepilogo per linea"
+    vista = st.radio(
+        "Visualizzazione",
+        options=[VISTA_COMPATTA, "Tutte le linee"],
+        index=0 if len(line_slices) > COMPACT_VIEW_MIN_LINES else 1,
+        horizontal=True,
+        help="Il riepilogo invia al browser solo la pagina della linea selezionata"
+    )
+
+    if vista == VISTA_COMPATTA and len(line_slices) > 0:
+        with recorder.stage("Riepilogo ordini per linea", rows=len(line_slices)):
+            st.dataframe(line_overview(work_orders_df, line_slices), use_container_width=True, hide_index=True)
+
+        slices_by_line = {linea: (start, stop) for linea, start, stop in line_slices}
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            linea = st.selectbox("Dettaglio linea", options=list(slices_by_line))
+        start, stop = slices_by_line[linea]
+        with col2:
+            _, _, n_pages = page_bounds(start, stop, 1)
+            page = st.number_input("Pagina", min_value=1, max_value=n_pages, value=1, step=1)
+        page_start, page_stop, _ = page_bounds(start, stop, page)
+
+        with recorder.stage("Rendering pagina linea", rows=page_stop - page_start):
+            st.markdown(f"#### Linea: {linea}")
+            st.dataframe(
+                line_display_frame(work_orders_df, page_start, page_stop),
+                use_container_width=True,
+                hide_index=True
+            )
+            st.caption(
+                f"Ordini {page_start - start + 1:,}-{page_stop - start:,} di {stop - start:,} "
+                f"(pagina {min(page, n_pages)} di {n_pages})"
+            )
+        st.markdown("---")
     else:
-        return "#28a745"
-
-def calculate_completion_date(min_prd, delay, working_hours_per_day=8):
-    days_needed = min_prd / (working_hours_per_day * 60)
-    total_days = days_needed + max(0, delay)
-    completion_date = datetime.now() + timedelta(days=total_days)
-    return completion_date
-
-def create_excel_download(df, sheet_name="Dati"):
-    output = BytesIO()
-    if df.empty:
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-        output.seek(0)
-        return output
-    
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
-        workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#1E3A5F',
-            'font_color': 'white',
-            'border': 1
-        })
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-            col_max_len = df[value].astype(str).apply(len).max() if len(df) > 0 else 0
-            max_len = max(col_max_len, len(str(value))) + 2
-            worksheet.set_column(col_num, col_num, min(max_len, 30))
-    output.seek(0)
-    return output
-
-def process_dataframe_by_position(df):
-    if len(df.columns) < MIN_REQUIRED_COLUMNS:
-        return None, f"Il file deve contenere almeno {MIN_REQUIRED_COLUMNS} colonne. Trovate: {len(df.columns)}"
-    
-    processed_df = pd.DataFrame()
-    for col_index, col_name in COLUMN_MAPPING.items():
-        processed_df[col_name] = df.iloc[:, col_index]
-    
-    for col in ['min_prd', 'ritardo_cartellino', 'M24_QT_SALDO']:
-        processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0)
-    
-    return processed_df, "OK"
+        with recorder.stage("Rendering ordini per linea", rows=len(work_orders_df)):
+            for linea, start, stop in line_slices:
+                st.markdown(f"#### Linea: {linea}")
+
+                st.dataframe(
+                    line_display_frame(work_orders_df, start, stop),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+                st.markdown("---")
+
+    excel_data = lazy_excel_export(work_orders_df, "Ordini_Lavoro")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="📥 Scarica Ordini di Lavoro (Excel)",
+            data=excel_data,
+            file_name=f"ordini_lavoro{'_ottimizzati' if optimized else ''}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+            mime=EXCEL_MIME
+        )
+    with col2:
+        st.button("🖨️ Stampa (Ctrl+P)", help="Usa Ctrl+P per stampare questa pagina")
+    close_fragment_recorder(recorder, "Ordini di Lavoro")
+
+@st.fragment
+def render_dashboard_tab(df, file_hash, planning_model):
+    recorder = fragment_recorder()
+    st.markdown("### Dashboard Gestionale")
+
+    metrics = planning_model['metrics']
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Ordini Totali", f"{metrics['total_orders']:,}")
+
+    with col2:
+        st.metric("Ore Produzione Totali", f"{metrics['total_hours']:,.1f}")
+
+    with col3:
+        st.metric("Ritardo Medio (giorni)", f"{metrics['avg_delay']:.1f}")
+
+    with col4:
+        st.metric("Ordini Critici", f"{metrics['critical_orders']}")
+
+    st.markdown("---")
+
+    plants = []
+    selected_plant = None
+    if PLANT_COLUMN in df.columns:
+        plants = plant_names(df, PLANT_COLUMN)
+    if len(plants) > 1:
+        st.markdown("#### Riepilogo per Stabilimento")
+        with recorder.stage("Riepilogo stabilimenti", rows=len(df)):
+            plant_summary = build_plant_summary(df, PLANT_COLUMN)
+        st.dataframe(plant_summary, use_container_width=True, hide_index=True)
+
+        selected_plant = st.selectbox(
+            "Stabilimento",
+            options=[None] + plants,
+            format_func=lambda plant: "Tutti gli stabilimenti" if plant is None else plant,
+            key="dashboard_plant"
+        )
+        if selected_plant is not None:
+            df = df[(df[PLANT_COLUMN] == selected_plant).to_numpy()]
+        st.markdown("---")
+
+    st.markdown("#### Riepilogo per Linea")
+
+    with recorder.stage("Riepilogo linee", rows=len(df)):
+        linea_summary = build_line_summary(df, planning_model['queue_minutes'])
+
+    st.dataframe(
+        linea_summary[LINE_SUMMARY_DISPLAY_COLUMNS],
+        use_container_width=True,
+        hide_index=True
+    )
+
+    st.markdown("---")
+    st.markdown("#### Analisi Colli di Bottiglia")
+
+    bottlenecks, high_delay_linee = find_bottlenecks(linea_summary)
+
+    if len(bottlenecks) > 0:
+        for _, row in bottlenecks.iterrows():
+            st.markdown(f"""
+            <div class="critical-box">
+                <strong>⚠️ Collo di Bottiglia: Linea {row['Linea']}</strong><br>
+                Carico: {row['Ore Totali']:.1f} ore ({row['N. Ordini']} ordini) - 
+                Ritardo medio: {row['Ritardo Medio']:.1f} giorni
+            </div>
+            """, unsafe_allow_html=True)
+    else:
+        st.markdown("""
+        <div class="success-box">
+            <strong>✅ Nessun collo di bottiglia rilevato</strong><br>
+            Il carico di lavoro è distribuito uniformemente tra le linee.
+        </div>
+        """, unsafe_allow_html=True)
+
+    if len(high_delay_linee) > 0:
+        for _, row in high_delay_linee.iterrows():
+            st.markdown(f"""
+            <div class="warning-box">
+                <strong>⏰ Ritardo Elevato: Linea {row['Linea']}</strong><br>
+                Ritardo medio: {row['Ritardo Medio']:.1f} giorni - 
+                Necessaria attenzione prioritaria
+            </div>
+            """, unsafe_allow_html=True)
+
+    st.markdown("#### Profilo di Carico nel Tempo")
+    st.caption(
+        "Minuti di ogni ordine nel periodo della sua scadenza (gli ordini già in ritardo pesano sul primo "
+        "periodo), confrontati con la capacità della linea. Un periodo è sovraccarico se l'utilizzo supera "
+        "il 100% o se resta arretrato dai periodi precedenti."
+    )
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        profile_hours = st.slider(
+            "Ore lavorative giornaliere", 4, 12, DEFAULT_WORKING_HOURS, key="dashboard_working_hours"
+        )
+    with col2:
+        bucket_label = st.radio("Periodo", options=list(BUCKET_DAYS), horizontal=True, key="dashboard_bucket")
+    with col3:
+        horizon_days = st.selectbox(
+            "Orizzonte (giorni)", options=HORIZON_OPTIONS,
+            index=HORIZON_OPTIONS.index(DEFAULT_HORIZON_DAYS), key="dashboard_horizon"
+        )
+    with col4:
+        measure = st.selectbox("Misura", options=list(PROFILE_MEASURES), key="dashboard_measure")
+
+    with recorder.stage("Profilo di carico", rows=len(df)):
+        profile = get_load_profile(
+            file_hash, COLUMN_MAPPING_VERSION, selected_plant, profile_hours, horizon_days,
+            BUCKET_DAYS[bucket_label], date.today(), df, planning_model['queue_minutes']
+        )
+        grid = heatmap_frame(profile, measure)
+
+    if len(grid) > 0:
+        # Al grafico arriva solo la griglia linee x periodi gia' aggregata
+        fig = go.Figure(go.Heatmap(
+            z=grid.to_numpy(),
+            x=grid.columns.tolist(),
+            y=grid.index.tolist(),
+            colorscale='RdYlGn_r' if measure == 'Utilizzo %' else 'Reds',
+            zmin=0,
+            zmax=UTILIZATION_COLOR_MAX if measure == 'Utilizzo %' else None,
+            colorbar={'title': {'text': measure}},
+            hovertemplate="Linea %{y}<br>Dal %{x}<br>" + measure + ": %{z}<extra></extra>",
+        ))
+        fig.update_layout(
+            height=min(200 + 18 * len(grid), 1200),
+            margin={'l': 10, 'r': 10, 't': 10, 'b': 10},
+            xaxis={'type': 'category'},
+            yaxis={'type': 'category', 'autorange': 'reversed'},
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    intervals = profile['intervals']
+    overloaded_lines = intervals['Linea'].nunique()
+    if overloaded_lines > 0:
+        st.markdown(f"""
+        <div class="warning-box">
+            <strong>📈 Sovraccarico nell'orizzonte: {overloaded_lines} linee</strong><br>
+            {len(intervals)} intervalli con richiesta oltre la capacità nei prossimi {horizon_days} giorni
+        </div>
+        """, unsafe_allow_html=True)
+        with st.expander("Intervalli di sovraccarico per linea"):
+            st.dataframe(intervals, use_container_width=True, hide_index=True)
+    with st.expander("Utilizzo per linea nell'orizzonte"):
+        st.dataframe(profile['summary'], use_container_width=True, hide_index=True)
+
+    dashboard_excel = lazy_excel_export(linea_summary, "Dashboard")
+    st.download_button(
+        label="📥 Scarica Report Dashboard (Excel)",
+        data=dashboard_excel,
+        file_name=f"dashboard_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+        mime=EXCEL_MIME
+    )
+    close_fragment_recorder(recorder, "Dashboard")
+
+@st.fragment
+def render_delivery_tab(df, file_hash, planning_model):
+    # Lo slider rilancia solo questo frammento: coda e linee arrivano gia' calcolate dal modello
+    recorder = fragment_recorder()
+    st.markdown("### Stime di Consegna")
+
+    st.markdown("#### Parametri di Calcolo")
+    working_hours = st.slider("Ore lavorative giornaliere", 4, 12, DEFAULT_WORKING_HOURS, key='delivery_working_hours')
+
+    col1, col2 = st.columns(2)
+    with col1:
+        scenarios = st.selectbox(
+            "Scenari simulati",
+            options=SCENARIO_OPTIONS,
+            index=len(SCENARIO_OPTIONS) - 1,
+            format_func=lambda n: f"{n:,}",
+            key='confidence_scenarios',
+            help="Ogni scenario estrae variabilita' dei tempi di lavorazione, resa delle linee e fermi"
+        )
+    with col2:
+        n_snapshots = len(saved_snapshot_list())
+        st.checkbox(
+            "Calibra sui caricamenti salvati",
+            key='confidence_calibrated',
+            disabled=n_snapshots < 2,
+            help="Stima la resa effettiva di ogni linea confrontando i caricamenti salvati in giorni diversi"
+        )
+
+    st.markdown("---")
+
+    with recorder.stage("Stime consegna", rows=len(df)):
+        delivery_df = build_delivery_estimates(df, working_hours, schedule=planning_model['schedule'])
+
+    with recorder.stage("Simulazione confidenza", rows=len(df)):
+        confidence = get_delivery_confidence(
+            file_hash, COLUMN_MAPPING_VERSION, scenarios,
+            confidence_calibration(df, working_hours), df, planning_model['schedule']
+        )
+        quantile_columns = [f"Consegna {label}" for label in CONFIDENCE_LABELS]
+        # L'indice di delivery_df e' la posizione della riga nel frame normalizzato
+        delivery_df = delivery_df.join(order_confidence(confidence, working_hours)[quantile_columns])
+
+    st.markdown("#### Riepilogo Consegne per Cliente")
+
+    with recorder.stage("Riepilogo clienti", rows=len(delivery_df)):
+        cliente_summary = build_client_summary(delivery_df)
+        cliente_summary = cliente_summary.merge(
+            client_confidence(confidence, working_hours)[['Cliente'] + quantile_columns], on='Cliente', how='left'
+        )
+
+    st.dataframe(cliente_summary, use_container_width=True, hide_index=True)
+    st.caption(
+        f"Date {' / '.join(CONFIDENCE_LABELS)}: consegna entro quella data nel 50% / 80% / 95% degli "
+        f"scenari ({confidence['scenarios']:,} scenari, {confidence['seconds']:.1f} s). "
+        f"Per i clienti conta l'ultimo ordine su tutte le linee. Data di impegno consigliata: {COMMITMENT_LABEL}."
+    )
+    with st.expander("Variabilita' usata nella simulazione", expanded=False):
+        st.dataframe(confidence['parameters'].round(3).reset_index(), use_container_width=True, hide_index=True)
+        st.caption(
+            "Fattore Medio: rapporto tra tempo reale e tempo pianificato della coda (1 = come pianificato); "
+            "CV: variabilita' relativa tra uno scenario e l'altro."
+        )
+
+    st.markdown("---")
+    st.markdown("#### Dettaglio Consegne")
+
+    linea_options = ['Tutte'] + planning_model['queue_minutes'].index.tolist()
+    selected_linea = st.selectbox(
+        "Filtra per Linea",
+        options=linea_options
+    )
+
+    if selected_linea != 'Tutte':
+        filtered_df = delivery_df[delivery_df['Linea'] == selected_linea]
+    else:
+        filtered_df = delivery_df
+
+    st.dataframe(
+        filtered_df,
+        use_container_width=True,
+        hide_index=True
+    )
+
+    delivery_excel = lazy_excel_export(delivery_df, "Stime_Consegna")
+    st.download_button(
+        label="📥 Scarica Stime Consegna (Excel)",
+        data=delivery_excel,
+        file_name=f"stime_consegna_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+        mime=EXCEL_MIME
+    )
+    close_fragment_recorder(recorder, "Stime Consegna")
+
+@st.fragment
+def render_whatif_tab(df, file_hash, planning_model):
+    recorder = fragment_recorder()
+    st.markdown("### Simula Nuovo Ordine")
+    st.markdown("*Calcola la data di consegna stimata per un nuovo ordine*")
+
+    whatif_profile = planning_model['whatif']
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        tipologia = st.selectbox(
+            "Tipologia Lavorazione",
+            options=PHASES,
+            help="Seleziona il tipo di lavorazione"
+        )
+
+    with col2:
+        metri = st.number_input(
+            "Metri da produrre",
+            min_value=100,
+            max_value=1000000,
+            value=10000,
+            step=1000,
+            help="Inserisci la quantità in metri"
+        )
+
+    with col3:
+        ritardo_nuovo = st.number_input(
+            "Priorità (giorni di ritardo)",
+            min_value=-30,
+            max_value=60,
+            value=0,
+            help="Il nuovo ordine passa davanti agli ordini con ritardo inferiore"
+        )
+
+    LINEA_AUTOMATICA = "Automatica (linea più libera)"
+    linea_scelta = st.selectbox(
+        "Linea di produzione",
+        options=[LINEA_AUTOMATICA] + phase_lines(whatif_profile, tipologia),
+        help="Linee che lavorano oggi la tipologia selezionata"
+    )
+
+    st.markdown("---")
+
+    if len(whatif_profile['lines']) == 0:
+        st.info("Nessuna linea presente nel file: impossibile simulare un nuovo ordine.")
+    else:
+        # Stessi scenari e stessa calibrazione della scheda Stime Consegna: la simulazione arriva
+        # dalla cache invece di essere rifatta a ogni caricamento
+        with recorder.stage("Simulazione confidenza", rows=len(df)):
+            confidence = get_delivery_confidence(
+                file_hash, COLUMN_MAPPING_VERSION,
+                st.session_state.get('confidence_scenarios', DEFAULT_SCENARIOS),
+                confidence_calibration(df, st.session_state.get('delivery_working_hours', DEFAULT_WORKING_HOURS)),
+                df, planning_model['schedule']
+            )
+        with recorder.stage("Simulazione ordine", rows=1):
+            quote = quote_order(
+                whatif_profile,
+                tipologia,
+                metri,
+                linea=None if linea_scelta == LINEA_AUTOMATICA else linea_scelta,
+                ritardo=ritardo_nuovo,
+                confidence=confidence
+            )
+
+        st.markdown("#### Risultato Simulazione")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Attesa in Coda", f"{quote['giorni_attesa']:.1f} giorni", help=f"{quote['ordini_davanti']} ordini davanti sulla linea {quote['linea']}")
+        with col2:
+            st.metric("Tempo Nuovo Ordine", f"{quote['giorni_ordine']:.1f} giorni")
+        with col3:
+            if quote['simulato']:
+                st.metric(
+                    f"Consegna {COMMITMENT_LABEL}", f"{quote['giorni_impegno']:.1f} giorni",
+                    help=" | ".join(f"{label}: {days:.1f} giorni" for label, days in quote['giorni_quantili'].items())
+                )
+            else:
+                st.metric("Buffer Prudenziale", f"+{SAFETY_BUFFER:.0%}")
+
+        st.markdown(f"""
+        <div class="success-box" style="text-align: center; font-size: 1.3rem;">
+            <strong>📅 Data Consegna Stimata: {quote['data_consegna'].strftime('%d/%m/%Y')}</strong><br>
+            <span style="font-size: 0.9rem;">Tipologia: {tipologia} | Metri: {metri:,} | Linea: {quote['linea']} | Giorni totali: {quote['giorni_impegno']:.1f}</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+        st.markdown("---")
+        st.markdown("**Parametri di calcolo:**")
+        st.markdown(f"""
+        - Resa stimata {tipologia}: **{minutes_per_metre(whatif_profile, tipologia):.4f} minuti/metro**
+        - Coda linea {quote['linea']} davanti al nuovo ordine: **{quote['minuti_attesa']:,.0f} minuti** ({quote['ordini_davanti']} ordini, {DEFAULT_WORKING_HOURS} ore/giorno)
+        """)
+        if quote['simulato']:
+            st.markdown(
+                f"- Data di consegna al **{COMMITMENT_LABEL}** su {confidence['scenarios']:,} scenari: "
+                + ", ".join(f"{label} **{days:.1f}** giorni" for label, days in quote['giorni_quantili'].items())
+            )
+        else:
+            st.markdown(f"- Buffer prudenziale: **+{SAFETY_BUFFER:.0%}** sul tempo totale")
+
+        with st.expander("📊 Carico attuale per linea e fase (ore)"):
+            st.dataframe(
+                (whatif_profile['line_phase_minutes'] / 60).round(1),
+                use_container_width=True
+            )
+
+        st.markdown("---")
+        st.markdown("#### Preventivi Multipli")
+        st.markdown("*Carica un elenco di ordini candidati (colonne: Tipologia, Metri; opzionali: Riferimento, Linea, Ritardo)*")
+
+        candidates_file = st.file_uploader(
+            "Ordini da quotare (.xlsx, .csv)",
+            type=['xlsx', 'csv'],
+            key="candidati"
+        )
+        if candidates_file is not None:
+            candidates, candidates_message = read_candidate_orders(candidates_file.getvalue(), candidates_file.name)
+            if candidates is None:
+                st.error(candidates_message)
+            else:
+                with recorder.stage("Preventivi multipli", rows=len(candidates)):
+                    quotes_df = quote_orders(whatif_profile, candidates, confidence=confidence)
+                st.dataframe(quotes_df, use_container_width=True, hide_index=True)
+                st.download_button(
+                    label="📥 Scarica Preventivi (Excel)",
+                    data=lazy_excel_export(quotes_df, "Preventivi"),
+                    file_name=f"preventivi_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                    mime=EXCEL_MIME
+                )
+    close_fragment_recorder(recorder, "Simula Nuovo Ordine")
+
+@st.fragment
+def render_history_tab(df, file_hash):
+    recorder = fragment_recorder()
+    st.markdown("### Storico Caricamenti")
+    st.markdown("*Confronto con un caricamento salvato: ordini nuovi, chiusi, modificati e variazione di carico per linea*")
+
+    snapshots = saved_snapshot_list()
+    others = snapshots[snapshots['Hash'] != file_hash]
+    if len(others) == 0:
+        st.info("Nessun altro caricamento salvato da confrontare con il file attuale.")
+        close_fragment_recorder(recorder, "Storico")
+        return
+
+    labels = [f"{row.Data} - {row.File} ({row.Righe:,} righe)" for row in others.itertuples()]
+    choice = st.selectbox("Confronta con", options=range(len(labels)), format_func=lambda i: labels[i])
+    base_path = others['Percorso'].iloc[choice]
+
+    with recorder.stage("Confronto snapshot", rows=len(df)):
+        diff = _cached_snapshot_diff(base_path, file_hash, df)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Ordini Nuovi", f"{len(diff['new']):,}")
+    with col2:
+        st.metric("Ordini Chiusi", f"{len(diff['closed']):,}")
+    with col3:
+        st.metric("Ordini Modificati", f"{len(diff['changed']):,}")
+    with col4:
+        st.metric("Variazione Carico (ore)", f"{diff['line_delta']['Delta Ore'].sum():+,.1f}")
+
+    st.markdown("#### Variazione Carico per Linea")
+    st.dataframe(diff['line_delta'], use_container_width=True, hide_index=True)
+    st.download_button(
+        label="📥 Scarica Variazioni per Linea (Excel)",
+        data=lazy_excel_export(diff['line_delta'], "Variazioni_Linee"),
+        file_name=f"variazioni_linee_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+        mime=EXCEL_MIME
+    )
+
+    for key, title in [('new', "🆕 Ordini nuovi"), ('closed', "✅ Ordini chiusi"), ('changed', "✏️ Ordini modificati")]:
+        with st.expander(f"{title} ({len(diff[key]):,})"):
+            st.dataframe(diff[key].head(DIFF_PREVIEW_ROWS), use_container_width=True, hide_index=True)
+            if len(diff[key]) > DIFF_PREVIEW_ROWS:
+                st.caption(f"Mostrati i primi {DIFF_PREVIEW_ROWS:,} ordini di {len(diff[key]):,}")
+    close_fragment_recorder(recorder, "Storico")
+
+def _reset_incremental():
+    st.session_state.pop('incremental', None)
+    # Nuova chiave: l'uploader si svuota e il delta appena annullato non viene riapplicato
+    st.session_state['delta_uploader_generation'] = st.session_state.get('delta_uploader_generation', 0) + 1
+
+@st.fragment
+def render_delta_tab(df, file_hash):
+    recorder = fragment_recorder()
+    st.markdown("### Aggiornamenti Incrementali")
+    st.markdown(
+        "*Applica un file delta (stesso formato del file completo): le righe aggiornano o aggiungono "
+        "cartellini per ID, le righe con saldo e minuti a zero li chiudono. Vengono ricalcolate solo le linee toccate.*"
+    )
+
+    if PLANT_COLUMN in df.columns and df[PLANT_COLUMN].nunique() > 1:
+        # Le linee sono qualificate dallo stabilimento e un file delta non dice a quale appartiene
+        st.info("Gli aggiornamenti incrementali sono disponibili solo per caricamenti di un singolo stabilimento.")
+        close_fragment_recorder(recorder, "Aggiornamenti")
+        return
+
+    incremental = st.session_state.get('incremental')
+    if incremental is not None and incremental['file_hash'] != file_hash:
+        st.session_state.pop('incremental', None)
+        incremental = None
+
+    delta_file = st.file_uploader(
+        "File delta (.xlsx, .csv, .parquet)",
+        type=SUPPORTED_FORMATS,
+        key=f"delta_{st.session_state.get('delta_uploader_generation', 0)}"
+    )
+    if delta_file is not None:
+        delta_bytes = delta_file.getvalue()
+        delta_hash = hashlib.sha256(delta_bytes).hexdigest()
+        # Ogni delta si applica una sola volta, anche se il frammento viene rieseguito
+        applied_hashes = [] if incremental is None else [entry['hash'] for entry in incremental['applied']]
+        if delta_hash not in applied_hashes:
+            delta_df, delta_message, _, _, _ = read_production_file(delta_bytes, delta_file.name)
+            if delta_df is None:
+                st.error(f"Errore nel file delta: {delta_message}")
+            else:
+                if incremental is None:
+                    # Lo stato per linea (copie del frame per linea) nasce solo con il primo delta:
+                    # le sessioni che non aggiornano nulla non lo pagano
+                    with recorder.stage("Stato incrementale", rows=len(df)):
+                        incremental = {
+                            'file_hash': file_hash,
+                            'state': build_incremental_state(df, DEFAULT_WORKING_HOURS),
+                            'applied': [],
+                        }
+                    st.session_state['incremental'] = incremental
+                with recorder.stage("Applicazione delta", rows=len(delta_df)):
+                    report = apply_delta(incremental['state'], delta_df)
+                incremental['applied'].append({'hash': delta_hash, 'file': delta_file.name, **report})
+
+    if incremental is None or not incremental['applied']:
+        st.info("Nessun delta applicato: i dati corrispondono al file caricato.")
+        close_fragment_recorder(recorder, "Aggiornamenti")
+        return
+    state = incremental['state']
+
+    st.dataframe(pd.DataFrame({
+        'File': [entry['file'] for entry in incremental['applied']],
+        'Nuovi': [entry['inserted'] for entry in incremental['applied']],
+        'Aggiornati': [entry['updated'] for entry in incremental['applied']],
+        'Chiusi': [entry['deleted'] for entry in incremental['applied']],
+        'Chiusure non trovate': [entry['missing_deletes'] for entry in incremental['applied']],
+        'Linee Ricalcolate': [len(entry['affected_lines']) for entry in incremental['applied']],
+    }), use_container_width=True, hide_index=True)
+
+    with recorder.stage("Riepiloghi incrementali", rows=len(state['line_totals'])):
+        linea_summary = incremental_line_summary(state)
+        cliente_summary = incremental_client_summary(state)
+        bottlenecks, _ = find_bottlenecks(linea_summary)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Ordini Aperti", f"{int(linea_summary['N. Ordini'].sum()):,}")
+    with col2:
+        st.metric("Ore Produzione Totali", f"{linea_summary['Ore Totali'].sum():,.1f}")
+    with col3:
+        st.metric("Colli di Bottiglia", f"{len(bottlenecks)}")
+
+    st.markdown("#### Riepilogo per Linea (aggiornato)")
+    st.dataframe(linea_summary[LINE_SUMMARY_DISPLAY_COLUMNS], use_container_width=True, hide_index=True)
+
+    st.markdown("#### Riepilogo Consegne per Cliente (aggiornato)")
+    st.dataframe(cliente_summary, use_container_width=True, hide_index=True)
+
+    last_lines = incremental['applied'][-1]['affected_lines']
+    st.markdown(f"#### Stime Ricalcolate nell'Ultimo Aggiornamento ({len(last_lines)} linee)")
+    st.dataframe(incremental_delivery_estimates(state, last_lines), use_container_width=True, hide_index=True)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button(
+            label="📥 Scarica Stime Aggiornate (Excel)",
+            # Le stime di tutte le linee vengono riunite solo al click
+            data=lambda: create_excel_download(incremental_delivery_estimates(state), "Stime_Consegna").getvalue(),
+            file_name=f"stime_consegna_aggiornate_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+            mime=EXCEL_MIME
+        )
+    with col2:
+        if st.button("💾 Salva come caricamento", help="Lo ritrovi tra i caricamenti salvati da riaprire"):
+            combined_hash = hashlib.sha256(
+                (file_hash + ''.join(entry['hash'] for entry in incremental['applied'])).encode()
+            ).hexdigest()
+            name = f"{incremental['applied'][0]['file']} +{len(incremental['applied'])} delta"
+            save_snapshot(current_frame(state), combined_hash, name)
+            prune_snapshots()
+            st.success("Caricamento aggiornato salvato.")
+    with col3:
+        st.button("↩️ Annulla aggiornamenti", on_click=_reset_incremental)
+    st.caption("Le altre schede mostrano il file caricato senza gli aggiornamenti.")
+    close_fragment_recorder(recorder, "Aggiornamenti")
 
 st.markdown('<p class="main-header">Pianificazione Produzione Tessile</p>', unsafe_allow_html=True)
 st.markdown('<p class="sub-header">Carica i dati di produzione per generare ordini di lavoro, dashboard gestionale e stime di consegna</p>', unsafe_allow_html=True)
 
-uploaded_file = st.file_uploader(
-    "Carica file Excel (.xlsx)",
-    type=['xlsx'],
-    help="Il file deve contenere almeno 8 colonne nell'ordine specificato (A-H)"
+uploaded_files = st.file_uploader(
+    "Carica file di produzione (.xlsx, .csv, .parquet)",
+    type=SUPPORTED_FORMATS,
+    accept_multiple_files=True,
+    help="Il file deve contenere almeno 8 colonne nell'ordine specificato (A-H). "
+         "Con piu' file (o fogli) ogni file e' uno stabilimento: le letture avvengono in parallelo"
 )
 
-if uploaded_file is not None:
+# L'elenco dei salvati serve solo quando non c'e' un file caricato
+selected_snapshot = None
+saved_snapshots = saved_snapshot_list() if not uploaded_files else None
+if saved_snapshots is not None and len(saved_snapshots) > 0:
+    snapshot_labels = [f"{row.Data} - {row.File} ({row.Righe:,} righe)" for row in saved_snapshots.itertuples()]
+    snapshot_choice = st.selectbox(
+        "Oppure riapri un caricamento salvato",
+        options=[None] + list(range(len(snapshot_labels))),
+        format_func=lambda i: "—" if i is None else snapshot_labels[i],
+        help="I caricamenti vengono salvati automaticamente e si riaprono senza rileggere il file. "
+             f"Per ogni stabilimento resta l'ultimo caricamento di ogni giorno, per {snapshot_keep_days()} giorni"
+    )
+    if snapshot_choice is not None:
+        selected_snapshot = saved_snapshots.iloc[snapshot_choice]
+
+file_hash = None
+if uploaded_files or selected_snapshot is not None:
     try:
-        df_raw = pd.read_excel(uploaded_file)
+        if uploaded_files:
+            with perf.stage("Lettura file") as record:
+                file_hash, (df, message, col_info_df, mapping_info_df, ingest_stats) = load_uploaded_files(uploaded_files)
+                record['rows'] = 0 if df is None else len(df)
+                record['cache'] = 'miss' if _parse_call_state.missed else 'hit'
+        else:
+            with perf.stage("Apertura snapshot") as record:
+                df = load_snapshot(selected_snapshot['Percorso'])
+                record['rows'] = len(df)
+            file_hash = selected_snapshot['Hash']
+            message, col_info_df, mapping_info_df, ingest_stats = "OK", None, None, None
         
-        with st.expander("🔧 Dettagli tecnici colonne", expanded=False):
-            st.markdown("**Colonne trovate nel file:**")
-            col_info = []
-            for i, col_name in enumerate(df_raw.columns):
-                col_letter = chr(65 + i) if i < 26 else f"Col{i}"
-                sample_values = df_raw.iloc[:3, i].tolist() if len(df_raw) > 0 else []
-                col_info.append({
-                    'Indice': i,
-                    'Lettera Excel': col_letter,
-                    'Nome Colonna': str(col_name),
-                    'Esempio Valori': str(sample_values[:3])
-                })
-            st.dataframe(pd.DataFrame(col_info), use_container_width=True, hide_index=True)
+        if col_info_df is not None:
+            with st.expander("🔧 Dettagli tecnici colonne", expanded=False):
+                st.markdown("**Colonne trovate nel file:**")
+                st.dataframe(col_info_df, use_container_width=True, hide_index=True)
             
-            st.markdown("**Mapping attuale usato dal sistema:**")
-            mapping_info = []
-            for idx, internal_name in COLUMN_MAPPING.items():
-                col_letter = chr(65 + idx) if idx < 26 else f"Col{idx}"
-                actual_col = df_raw.columns[idx] if idx < len(df_raw.columns) else "N/A"
-                mapping_info.append({
-                    'Indice': idx,
-                    'Lettera': col_letter,
-                    'Colonna Reale nel File': str(actual_col),
-                    'Nome Interno Sistema': internal_name
-                })
-            st.dataframe(pd.DataFrame(mapping_info), use_container_width=True, hide_index=True)
-        
-        df, message = process_dataframe_by_position(df_raw)
+                st.markdown("**Mapping attuale usato dal sistema:**")
+                st.dataframe(mapping_info_df, use_container_width=True, hide_index=True)
+            
+                cache_stats = get_parse_cache_stats()
+                st.caption(
+                    f"Cache lettura file: {cache_stats['hits']} hit / {cache_stats['misses']} miss "
+                    f"(max {PARSE_CACHE_MAX_ENTRIES} file, mapping v{COLUMN_MAPPING_VERSION})"
+                )
+                if ingest_stats is not None:
+                    high_water_text = "n/d" if ingest_stats['rss_high_water_mb'] is None else (
+                        f"{ingest_stats['rss_high_water_mb']:,.0f} MB "
+                        f"(+{ingest_stats['rss_high_water_growth_mb']:,.0f} MB durante la lettura)"
+                    )
+                    retained_text = "n/d" if ingest_stats['rss_retained_mb'] is None else (
+                        f"{ingest_stats['rss_retained_mb']:+,.0f} MB"
+                    )
+                    st.caption(
+                        f"Lettura {ingest_stats['format'].upper()}: {ingest_stats['seconds']:.2f} s, "
+                        f"{ingest_stats['rows']:,} righe, massimo storico RSS processo {high_water_text}, "
+                        f"RSS trattenuto dalla lettura {retained_text}"
+                    )
+                    if ingest_stats['skipped_rows'] > 0:
+                        st.caption(
+                            f"{ingest_stats['skipped_rows']:,} righe scartate perche' vuote "
+                            "in tutte le colonne mappate"
+                        )
+                if ingest_stats is not None and len(ingest_stats['sources']) > 1:
+                    st.markdown("**File e fogli letti:**")
+                    st.dataframe(ingest_stats['sources'], use_container_width=True, hide_index=True)
+                    st.caption(f"Letture eseguite su {ingest_stats['workers']} processi")
+                if ingest_stats is not None and ingest_stats['memory_report'] is not None:
+                    memory_df = ingest_stats['memory_report']
+                    st.markdown("**Occupazione memoria dati normalizzati:**")
+                    st.dataframe(memory_df, use_container_width=True, hide_index=True)
+                    st.caption(
+                        f"Totale: {memory_df['Memoria Attuale (KB)'].sum() / 1024:,.1f} MB "
+                        f"(prima della compattazione: {memory_df['Memoria Originale (KB)'].sum() / 1024:,.1f} MB)"
+                    )
         
+        if ingest_stats is not None:
+            failed_sources = ingest_stats['sources'][ingest_stats['sources']['Esito'] != "OK"]
+            for row in failed_sources.itertuples():
+                st.warning(f"{row.Origine} non incluso: {row.Esito}")
+
         if df is None:
             st.error(f"Errore nei dati: {message}")
         else:
-            st.success(f"File caricato con successo! {len(df)} righe trovate.")
+            if uploaded_files:
+                upload_names = ", ".join(uploaded_file.name for uploaded_file in uploaded_files)
+                st.success(f"File caricato con successo! {len(df)} righe trovate.")
+                try:
+                    with perf.stage("Salvataggio snapshot", rows=len(df)):
+                        persist_snapshot(file_hash, COLUMN_MAPPING_VERSION, date.today(), upload_names, df)
+                except OSError as e:
+                    st.warning(f"Impossibile salvare lo snapshot del caricamento: {e}")
+            else:
+                st.success(
+                    f"Caricamento del {selected_snapshot['Data']} riaperto ({selected_snapshot['File']}): "
+                    f"{len(df)} righe."
+                )
+            
+            # Modello condiviso dalle schede: ogni scheda e' un frammento che rilegge solo cio' che le serve
+            with perf.stage("Modello di pianificazione", rows=len(df)):
+                planning_model = get_planning_model(file_hash, COLUMN_MAPPING_VERSION, df)
             
-            tab1, tab2, tab3, tab4 = st.tabs([
+            tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
                 "📋 Ordini di Lavoro", 
                 "📊 Dashboard Gestionale", 
                 "📅 Stime Consegna",
-                "🧮 Simula Nuovo Ordine"
+                "🧮 Simula Nuovo Ordine",
+                "🗂️ Storico",
+                "🔄 Aggiornamenti"
             ])
             
+            
             with tab1:
-                st.markdown("### Ordini di Lavoro per Linea")
-                st.markdown("*Ordinati per ritardo (priorità decrescente)*")
-                
-                work_orders_list = []
-                
-                for linea in sorted(df['Linea'].astype(str).unique()):
-                    linea_df = df[df['Linea'].astype(str) == linea].copy()
-                    linea_df = linea_df.sort_values('ritardo_cartellino', ascending=False)
-                    
-                    st.markdown(f"#### Linea: {linea}")
-                    
-                    display_df = linea_df[['ID_Cartellino', 'Cliente', 'Articolo', 'Macro_Fase', 'min_prd', 'ritardo_cartellino']].copy()
-                    display_df['Priorità'] = display_df['ritardo_cartellino'].apply(get_priority_status)
-                    display_df = display_df.rename(columns={
-                        'ID_Cartellino': 'ID',
-                        'Macro_Fase': 'Fase',
-                        'min_prd': 'Minuti Produzione',
-                        'ritardo_cartellino': 'Ritardo (giorni)'
-                    })
-                    
-                    st.dataframe(
-                        display_df,
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                    
-                    for _, row in linea_df.iterrows():
-                        work_orders_list.append({
-                            'Linea': linea,
-                            'ID': row['ID_Cartellino'],
-                            'Cliente': row['Cliente'],
-                            'Articolo': row['Articolo'],
-                            'Fase': row['Macro_Fase'],
-                            'Minuti Produzione': row['min_prd'],
-                            'Ritardo (giorni)': row['ritardo_cartellino'],
-                            'Priorità': get_priority_status(row['ritardo_cartellino'])
-                        })
-                    
-                    st.markdown("---")
-                
-                work_orders_df = pd.DataFrame(work_orders_list)
-                excel_data = create_excel_download(work_orders_df, "Ordini_Lavoro")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.download_button(
-                        label="📥 Scarica Ordini di Lavoro (Excel)",
-                        data=excel_data,
-                        file_name=f"ordini_lavoro_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                with col2:
-                    st.button("🖨️ Stampa (Ctrl+P)", help="Usa Ctrl+P per stampare questa pagina")
+                render_work_orders_tab(df, file_hash, planning_model)
             
             with tab2:
-                st.markdown("### Dashboard Gestionale")
-                
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    total_orders = len(df)
-                    st.metric("Ordini Totali", f"{total_orders:,}")
-                
-                with col2:
-                    total_min = df['min_prd'].sum()
-                    total_hours = total_min / 60
-                    st.metric("Ore Produzione Totali", f"{total_hours:,.1f}")
-                
-                with col3:
-                    avg_delay = df['ritardo_cartellino'].mean()
-                    st.metric("Ritardo Medio (giorni)", f"{avg_delay:.1f}")
-                
-                with col4:
-                    critical_orders = len(df[df['ritardo_cartellino'] > 10])
-                    st.metric("Ordini Critici", f"{critical_orders}")
-                
-                st.markdown("---")
-                
-                st.markdown("#### Riepilogo per Linea")
-                
-                linea_summary = df.groupby(df['Linea'].astype(str)).agg({
-                    'ID_Cartellino': 'count',
-                    'min_prd': 'sum',
-                    'ritardo_cartellino': 'mean',
-                    'M24_QT_SALDO': 'sum'
-                }).reset_index()
-                
-                linea_summary.columns = ['Linea', 'N. Ordini', 'Minuti Totali', 'Ritardo Medio', 'Quantità Saldo']
-                linea_summary['Ore Totali'] = (linea_summary['Minuti Totali'] / 60).round(1)
-                linea_summary['Ritardo Medio'] = linea_summary['Ritardo Medio'].round(1)
-                
-                st.dataframe(
-                    linea_summary[['Linea', 'N. Ordini', 'Ore Totali', 'Ritardo Medio', 'Quantità Saldo']],
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-                st.markdown("---")
-                st.markdown("#### Analisi Colli di Bottiglia")
-                
-                bottleneck_threshold = linea_summary['Ore Totali'].mean() * 1.5
-                bottlenecks = linea_summary[linea_summary['Ore Totali'] > bottleneck_threshold]
-                
-                if len(bottlenecks) > 0:
-                    for _, row in bottlenecks.iterrows():
-                        st.markdown(f"""
-                        <div class="critical-box">
-                            <strong>⚠️ Collo di Bottiglia: Linea {row['Linea']}</strong><br>
-                            Carico: {row['Ore Totali']:.1f} ore ({row['N. Ordini']} ordini) - 
-                            Ritardo medio: {row['Ritardo Medio']:.1f} giorni
-                        </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.markdown("""
-                    <div class="success-box">
-                        <strong>✅ Nessun collo di bottiglia rilevato</strong><br>
-                        Il carico di lavoro è distribuito uniformemente tra le linee.
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                high_delay_linee = linea_summary[linea_summary['Ritardo Medio'] > 5]
-                if len(high_delay_linee) > 0:
-                    for _, row in high_delay_linee.iterrows():
-                        st.markdown(f"""
-                        <div class="warning-box">
-                            <strong>⏰ Ritardo Elevato: Linea {row['Linea']}</strong><br>
-                            Ritardo medio: {row['Ritardo Medio']:.1f} giorni - 
-                            Necessaria attenzione prioritaria
-                        </div>
-                        """, unsafe_allow_html=True)
-                
-                dashboard_excel = create_excel_download(linea_summary, "Dashboard")
-                st.download_button(
-                    label="📥 Scarica Report Dashboard (Excel)",
-                    data=dashboard_excel,
-                    file_name=f"dashboard_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                render_dashboard_tab(df, file_hash, planning_model)
             
             with tab3:
-                st.markdown("### Stime di Consegna")
-                
-                st.markdown("#### Parametri di Calcolo")
-                working_hours = st.slider("Ore lavorative giornaliere", 4, 12, 8)
-                
-                st.markdown("---")
-                
-                delivery_data = []
-                
-                for _, row in df.iterrows():
-                    completion_date = calculate_completion_date(
-                        row['min_prd'], 
-                        row['ritardo_cartellino'],
-                        working_hours
-                    )
-                    days_to_complete = (completion_date - datetime.now()).days
-                    
-                    delivery_data.append({
-                        'ID': row['ID_Cartellino'],
-                        'Cliente': row['Cliente'],
-                        'Articolo': row['Articolo'],
-                        'Linea': row['Linea'],
-                        'Minuti Produzione': row['min_prd'],
-                        'Ritardo Attuale': row['ritardo_cartellino'],
-                        'Data Completamento Stimata': completion_date.strftime('%d/%m/%Y'),
-                        'Giorni al Completamento': days_to_complete,
-                        'Priorità': get_priority_status(row['ritardo_cartellino'])
-                    })
-                
-                delivery_df = pd.DataFrame(delivery_data)
-                delivery_df = delivery_df.sort_values('Giorni al Completamento', ascending=False)
-                
-                st.markdown("#### Riepilogo Consegne per Cliente")
-                
-                cliente_summary = delivery_df.groupby('Cliente').agg({
-                    'ID': 'count',
-                    'Minuti Produzione': 'sum',
-                    'Giorni al Completamento': 'max'
-                }).reset_index()
-                cliente_summary.columns = ['Cliente', 'N. Ordini', 'Minuti Totali', 'Giorni Max Completamento']
-                cliente_summary = cliente_summary.sort_values('Giorni Max Completamento', ascending=False)
-                
-                st.dataframe(cliente_summary, use_container_width=True, hide_index=True)
-                
-                st.markdown("---")
-                st.markdown("#### Dettaglio Consegne")
-                
-                linea_options = ['Tutte'] + sorted(df['Linea'].astype(str).unique().tolist())
-                selected_linea = st.selectbox(
-                    "Filtra per Linea",
-                    options=linea_options
-                )
-                
-                if selected_linea != 'Tutte':
-                    filtered_df = delivery_df[delivery_df['Linea'].astype(str) == selected_linea]
-                else:
-                    filtered_df = delivery_df
-                
-                st.dataframe(
-                    filtered_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-                delivery_excel = create_excel_download(delivery_df, "Stime_Consegna")
-                st.download_button(
-                    label="📥 Scarica Stime Consegna (Excel)",
-                    data=delivery_excel,
-                    file_name=f"stime_consegna_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                render_delivery_tab(df, file_hash, planning_model)
             
             with tab4:
-                st.markdown("### Simula Nuovo Ordine")
-                st.markdown("*Calcola la data di consegna stimata per un nuovo ordine*")
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    tipologia = st.selectbox(
-                        "Tipologia Lavorazione",
-                        options=["BIANCO", "TINTO", "FINISSAGGIO"],
-                        help="Seleziona il tipo di lavorazione"
-                    )
-                
-                with col2:
-                    metri = st.number_input(
-                        "Metri da produrre",
-                        min_value=100,
-                        max_value=1000000,
-                        value=10000,
-                        step=1000,
-                        help="Inserisci la quantità in metri"
-                    )
-                
-                st.markdown("---")
-                
-                METRI_GIORNO = 100000
-                total_min_prd = df['min_prd'].sum()
-                carico_attuale_giorni = total_min_prd / (8 * 60)
-                
-                giorni_nuovo_ordine = metri / METRI_GIORNO
-                giorni_totali = carico_attuale_giorni + giorni_nuovo_ordine
-                giorni_con_buffer = giorni_totali * 1.20
-                
-                data_consegna = datetime.now() + timedelta(days=giorni_con_buffer)
-                
-                st.markdown("#### Risultato Simulazione")
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Carico Attuale", f"{carico_attuale_giorni:.1f} giorni")
-                with col2:
-                    st.metric("Tempo Nuovo Ordine", f"{giorni_nuovo_ordine:.1f} giorni")
-                with col3:
-                    st.metric("Buffer Prudenziale", "+20%")
-                
-                st.markdown(f"""
-                <div class="success-box" style="text-align: center; font-size: 1.3rem;">
-                    <strong>📅 Data Consegna Stimata: {data_consegna.strftime('%d/%m/%Y')}</strong><br>
-                    <span style="font-size: 0.9rem;">Tipologia: {tipologia} | Metri: {metri:,} | Giorni totali: {giorni_con_buffer:.1f}</span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown("---")
-                st.markdown("**Parametri di calcolo:**")
-                st.markdown(f"""
-                - Capacità produttiva giornaliera: **{METRI_GIORNO:,} metri/giorno**
-                - Carico produzione attuale: **{total_min_prd:,.0f} minuti** ({carico_attuale_giorni:.1f} giorni)
-                - Buffer prudenziale: **+20%** sul tempo totale
-                """)
+                render_whatif_tab(df, file_hash, planning_model)
+            
+            with tab5:
+                render_history_tab(df, file_hash)
+            
+            with tab6:
+                render_delta_tab(df, file_hash)
                 
     except Exception as e:
         st.error(f"Errore durante l'elaborazione del file: {str(e)}")
-        st.info("Verifica che il file sia un documento Excel valido (.xlsx)")
+        st.info("Verifica che il file sia un documento valido (.xlsx, .csv o .parquet)")
 
 else:
-    st.info("👆 Carica un file Excel per iniziare l'analisi della produzione")
+    st.info("👆 Carica un file Excel, CSV o Parquet per iniziare l'analisi della produzione")
     
     with st.expander("ℹ️ Formato file richiesto"):
         st.markdown("""
@@ -488,8 +1130,34 @@ else:
         
         **Nota:** I nomi delle intestazioni nel file Excel possono essere qualsiasi. 
         Il sistema legge i dati in base alla posizione delle colonne (A, B, C, ecc.).
+        Sono accettate anche esportazioni CSV e Parquet con lo stesso ordine di colonne.
         """)
 
+def _request_profile():
+    st.session_state['perf_profile_next'] = True
+
+if PERF_ENABLED:
+    profile_path, profile_summary = perf.stop_profile(profile_dir())
+    perf_entry = perf.log_entry(kind='rerun', file_hash=file_hash, profile=profile_path)
+    append_log(perf_entry)
+    record_perf_history(perf_entry, "Pagina")
+    perf.finished = True
+    
+    with st.sidebar.expander("⏱️ Prestazioni", expanded=True):
+        st.markdown("**Ultima esecuzione:**")
+        st.dataframe(perf.to_frame(), use_container_width=True, hide_index=True)
+        st.caption(f"Totale: {perf_entry['total_seconds']:.3f} s - log in {perf_log_path()}")
+        st.markdown(f"**Ultime {PERF_HISTORY_RERUNS} esecuzioni:**")
+        st.dataframe(pd.DataFrame(st.session_state['perf_history'][::-1]), use_container_width=True, hide_index=True)
+        st.button(
+            "🔬 Profila la prossima esecuzione",
+            on_click=_request_profile,
+            help="Salva un profilo cProfile dell'esecuzione avviata dal click"
+        )
+        if profile_path is not None:
+            st.success(f"Profilo salvato in {profile_path}")
+            st.code(profile_summary)
+
 st.markdown("---")
 st.markdown(
     "<p style='text-align: center; color: #888; font-size: 0.9rem;'>"
@@ -0,0 +1,241 @@
+"""Misura ogni stadio della pipeline su export sintetici di dimensione crescente.
+
+Uso: python benchmarks/bench_pipeline.py [--rows 1000 10000 100000] [--json risultati.json] [--profile-dir prof]
+
+Il JSON prodotto contiene commit, versioni delle librerie e i tempi per stadio, cosi' due
+esecuzioni su versioni diverse del codice si possono confrontare direttamente.
+"""
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from planner.capacity import build_load_profile  # noqa: E402
+from planner.confidence import simulate_completion  # noqa: E402
+from planner.estimates import build_delivery_estimates  # noqa: E402
+from planner.export import create_excel_download  # noqa: E402
+from planner.ingestion import process_dataframe_by_position, read_production_file  # noqa: E402
+from planner.scheduling import build_line_schedule, line_loads  # noqa: E402
+from planner.summaries import build_line_summary  # noqa: E402
+from planner.synthetic import DELAY_DISTRIBUTIONS, generate_production_frame  # noqa: E402
+from planner.work_orders import build_work_orders, line_display_frame  # noqa: E402
+
+# Stadi nell'ordine in cui li attraversa l'app; ognuno riceve lo stato prodotto dai precedenti
+STAGES = [
+    'read_excel',
+    'process_dataframe_by_position',
+    'read_production_file',
+    'schedule',
+    'work_orders',
+    'line_summary',
+    'load_profile',
+    'delivery',
+    'delivery_confidence',
+    'excel_export',
+]
+
+PROFILE_TOP_FUNCTIONS = 10
+
+
+def _read_excel(state):
+    state['raw'] = pd.read_excel(io.BytesIO(state['workbook']))
+
+
+def _process(state):
+    state['df'], _ = process_dataframe_by_position(state.get('raw', state['generated']))
+
+
+def _read_production_file(state):
+    state['df'] = read_production_file(state['workbook'], 'benchmark.xlsx')[0]
+
+
+def _schedule(state):
+    state['schedule'] = build_line_schedule(state['df'])
+    state['queue_minutes'] = line_loads(state['schedule'])
+
+
+def _work_orders(state):
+    work_orders_df, line_slices = build_work_orders(state['df'])
+    for _, start, stop in line_slices:
+        line_display_frame(work_orders_df, start, stop)
+
+
+def _line_summary(state):
+    build_line_summary(state['df'], state['queue_minutes'], state['reference_time'])
+
+
+def _load_profile(state):
+    build_load_profile(state['df'], state['queue_minutes'], reference_date=state['reference_time'].date())
+
+
+def _delivery(state):
+    state['delivery'] = build_delivery_estimates(
+        state['df'], reference_time=state['reference_time'], schedule=state['schedule']
+    )
+
+
+def _delivery_confidence(state):
+    simulate_completion(state['df'], state['schedule'])
+
+
+def _excel_export(state):
+    create_excel_download(state['delivery'], 'Stime Consegna').getvalue()
+
+
+STAGE_FUNCTIONS = {
+    'read_excel': _read_excel,
+    'process_dataframe_by_position': _process,
+    'read_production_file': _read_production_file,
+    'schedule': _schedule,
+    'work_orders': _work_orders,
+    'line_summary': _line_summary,
+    'load_profile': _load_profile,
+    'delivery': _delivery,
+    'delivery_confidence': _delivery_confidence,
+    'excel_export': _excel_export,
+}
+
+
+def _requires(stage, stages):
+    # Gli stadi a valle hanno bisogno almeno di df, schedule e delivery
+    needed = {
+        'schedule': ['process_dataframe_by_position'],
+        'work_orders': ['process_dataframe_by_position'],
+        'line_summary': ['process_dataframe_by_position', 'schedule'],
+        'load_profile': ['process_dataframe_by_position', 'schedule'],
+        'delivery': ['process_dataframe_by_position', 'schedule'],
+        'delivery_confidence': ['process_dataframe_by_position', 'schedule'],
+        'excel_export': ['process_dataframe_by_position', 'schedule', 'delivery'],
+    }
+    return [dep for dep in needed.get(stage, []) if dep not in stages]
+
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler)
+    stats.sort_stats('cumulative')
+    rows = []
+    for (filename, line, name), (_, calls, _, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.relpath(filename, ROOT) if filename.startswith(ROOT) else filename}:{line}({name})",
+            'calls': calls,
+            'cumulative_s': round(cumulative, 6),
+        })
+    rows.sort(key=lambda row: row['cumulative_s'], reverse=True)
+    return rows[:PROFILE_TOP_FUNCTIONS]
+
+
+def run_stage(stage, state, repeat, profile_dir=None, rows=0):
+    func = STAGE_FUNCTIONS[stage]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(state)
+        timings.append(time.perf_counter() - start)
+    result = {
+        'stage': stage,
+        'rows': rows,
+        'best_s': round(min(timings), 6),
+        'mean_s': round(sum(timings) / len(timings), 6),
+        'runs': len(timings),
+    }
+    if profile_dir is not None:
+        # Esecuzione separata: il profiler rallenta il codice e non deve sporcare i tempi
+        profiler = cProfile.Profile()
+        profiler.runcall(func, state)
+        profiler.dump_stats(os.path.join(profile_dir, f"{stage}_{rows}.prof"))
+        result['profile_top'] = _top_functions(profiler)
+    return result
+
+
+def _git_commit():
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--delay-distribution', choices=DELAY_DISTRIBUTIONS, default='normal')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help="stadi da misurare (default: tutti)")
+    parser.add_argument('--json', help="file JSON dei risultati (default: stdout)")
+    parser.add_argument('--profile-dir', help="salva un .prof cProfile per stadio e dimensione")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stages = [stage for stage in STAGES if stage in args.stages]
+    for stage in stages:
+        missing = _requires(stage, stages)
+        if missing:
+            print(f"Lo stadio {stage} richiede anche: {', '.join(missing)}", file=sys.stderr)
+            return 2
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+
+    results = []
+    for rows in args.rows:
+        generated = generate_production_frame(
+            rows, lines=args.lines, customers=args.customers,
+            delay_distribution=args.delay_distribution, seed=args.seed
+        )
+        state = {
+            'generated': generated,
+            'workbook': create_excel_download(generated, 'Export').getvalue(),
+            'reference_time': datetime(2025, 1, 1),
+        }
+        for stage in stages:
+            result = run_stage(stage, state, args.repeat, args.profile_dir, rows)
+            results.append(result)
+            print(f"{rows:>9,} {stage:<30} {result['best_s']:>10.4f} s", file=sys.stderr)
+
+    report = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'parameters': {
+            'lines': args.lines,
+            'customers': args.customers,
+            'delay_distribution': args.delay_distribution,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
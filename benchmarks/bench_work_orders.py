@@ -0,0 +1,82 @@
+"""Confronta il vecchio ciclo per linea con build_work_orders al crescere del numero di linee.
+
+Uso: python benchmarks/bench_work_orders.py [--rows 100000] [--lines 10 50 200 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner.ingestion import process_dataframe_by_position  # noqa: E402
+from planner.priority import get_priority_status  # noqa: E402
+from planner.synthetic import generate_production_frame  # noqa: E402
+from planner.work_orders import build_work_orders, line_display_frame  # noqa: E402
+
+
+def make_frame(rows, lines, seed=0):
+    df, _ = process_dataframe_by_position(generate_production_frame(rows, lines=lines, seed=seed))
+    return df
+
+
+def legacy_work_orders(df):
+    work_orders_list = []
+    for linea in sorted(df['Linea'].astype(str).unique()):
+        linea_df = df[df['Linea'].astype(str) == linea].copy()
+        linea_df = linea_df.sort_values('ritardo_cartellino', ascending=False)
+        display_df = linea_df[['ID_Cartellino', 'Cliente', 'Articolo', 'Macro_Fase', 'min_prd', 'ritardo_cartellino']].copy()
+        display_df['Priorità'] = display_df['ritardo_cartellino'].apply(get_priority_status)
+        for _, row in linea_df.iterrows():
+            work_orders_list.append({
+                'Linea': linea,
+                'ID': row['ID_Cartellino'],
+                'Cliente': row['Cliente'],
+                'Articolo': row['Articolo'],
+                'Fase': row['Macro_Fase'],
+                'Minuti Produzione': row['min_prd'],
+                'Ritardo (giorni)': row['ritardo_cartellino'],
+                'Priorità': get_priority_status(row['ritardo_cartellino'])
+            })
+    return pd.DataFrame(work_orders_list)
+
+
+def grouped_work_orders(df):
+    work_orders_df, line_slices = build_work_orders(df)
+    for _, start, stop in line_slices:
+        line_display_frame(work_orders_df, start, stop)
+    return work_orders_df
+
+
+def best_of(func, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--lines', type=int, nargs='+', default=[10, 50, 200, 500])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy', action='store_true', help="misura solo build_work_orders")
+    args = parser.parse_args()
+
+    print(f"{'linee':>6} {'righe':>9} {'legacy (s)':>11} {'grouped (s)':>12} {'speedup':>8}")
+    for lines in args.lines:
+        df = make_frame(args.rows, lines)
+        grouped = best_of(grouped_work_orders, df, args.repeat)
+        if args.skip_legacy:
+            print(f"{lines:>6} {args.rows:>9,} {'-':>11} {grouped:>12.4f} {'-':>8}")
+            continue
+        legacy = best_of(legacy_work_orders, df, 1)
+        print(f"{lines:>6} {args.rows:>9,} {legacy:>11.3f} {grouped:>12.4f} {legacy / grouped:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
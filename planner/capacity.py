@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from planner.scheduling import DEFAULT_WORKING_HOURS, line_categories
+
+DEFAULT_HORIZON_DAYS = 90
+
+BUCKET_DAYS = {'Giorno': 1, 'Settimana': 7}
+
+# Oltre questo utilizzo un periodo e' sovraccarico anche senza arretrato accumulato
+OVERLOAD_UTILIZATION = 1.0
+
+PROFILE_MEASURES = {
+    'Utilizzo %': 'utilization',
+    'Arretrato (ore)': 'backlog',
+    'Ore Pianificate': 'scheduled',
+}
+
+
+def _bucket_edges(horizon_days, bucket_days):
+    n_buckets = int(np.ceil(horizon_days / bucket_days))
+    edges = np.arange(n_buckets + 1) * bucket_days
+    edges[-1] = horizon_days
+    return edges
+
+
+def _overload_runs(overloaded):
+    # Inizio e fine (esclusa) di ogni tratto contiguo di periodi sovraccarichi, per tutte
+    # le linee insieme: i bordi dei tratti sono i cambi di valore lungo i periodi
+    n_lines = overloaded.shape[0]
+    padded = np.zeros((n_lines, overloaded.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = overloaded
+    change = np.diff(padded, axis=1)
+    line_start, start = np.nonzero(change == 1)
+    _, stop = np.nonzero(change == -1)
+    return line_start, start, stop
+
+
+def _run_max(values, line_index, start, stop):
+    # Massimo di ogni tratto con un solo reduceat sulla griglia appiattita; il valore in coda
+    # rende valido anche l'indice di fine dell'ultimo tratto
+    if len(line_index) == 0:
+        return np.zeros(0)
+    n_buckets = values.shape[1]
+    flat = np.append(values.ravel(), 0.0)
+    bounds = np.column_stack([line_index * n_buckets + start, line_index * n_buckets + stop]).ravel()
+    return np.maximum.reduceat(flat, bounds)[::2]
+
+
+def build_load_profile(df, queue_minutes=None, working_hours_per_day=DEFAULT_WORKING_HOURS,
+                       horizon_days=DEFAULT_HORIZON_DAYS, bucket_days=1, reference_date=None):
+    if reference_date is None:
+        reference_date = date.today()
+    # Solo le linee con ordini: il frame puo' essere filtrato per stabilimento
+    linee = line_categories(df).remove_unused_categories()
+    lines = [str(linea) for linea in linee.categories]
+    n_lines = len(lines)
+    edges = _bucket_edges(horizon_days, bucket_days)
+    n_buckets = len(edges) - 1
+    capacity = np.diff(edges) * working_hours_per_day * 60.0
+
+    # Richiesta: minuti di ogni ordine nel periodo della sua scadenza. Un ordine gia' in
+    # ritardo e' dovuto subito, quindi pesa sul primo periodo
+    minutes = np.clip(df['min_prd'].to_numpy(dtype='float64'), 0, None)
+    due_day = np.floor(-df['ritardo_cartellino'].to_numpy(dtype='float64'))
+    due_day = np.clip(np.nan_to_num(due_day, nan=0.0), 0, None)
+    in_horizon = due_day < horizon_days
+    bucket = np.searchsorted(edges, due_day[in_horizon], side='right') - 1
+    cell = linee.codes[in_horizon].astype('int64') * n_buckets + bucket
+    required = np.bincount(cell, weights=minutes[in_horizon], minlength=n_lines * n_buckets)
+    required = required.reshape(n_lines, n_buckets)
+    beyond = np.bincount(linee.codes[~in_horizon], weights=minutes[~in_horizon], minlength=n_lines)
+
+    # Coda distribuita sul calendario: ogni linea lavora a piena capacita' fino a fine coda
+    if queue_minutes is None:
+        queue_minutes = pd.Series(np.bincount(linee.codes, weights=minutes, minlength=n_lines), index=lines)
+    queue = queue_minutes.reindex(lines).fillna(0).to_numpy(dtype='float64')
+    bucket_start = np.concatenate([[0.0], np.cumsum(capacity)[:-1]])
+    scheduled = np.clip(queue[:, None] - bucket_start[None, :], 0, capacity[None, :])
+
+    # Arretrato a fine periodo: b_t = max(0, b_(t-1) + richiesta_t - capacita'_t), che in forma
+    # chiusa e' la somma cumulata meno il suo minimo corrente
+    net = np.cumsum(required - capacity[None, :], axis=1)
+    backlog = net - np.minimum(np.minimum.accumulate(net, axis=1), 0)
+    utilization = required / capacity[None, :]
+    overloaded = (backlog > 0) | (utilization > OVERLOAD_UTILIZATION)
+
+    starts = [reference_date + timedelta(days=int(day)) for day in edges[:-1]]
+    ends = [reference_date + timedelta(days=int(day) - 1) for day in edges[1:]]
+
+    line_index, run_start, run_stop = _overload_runs(overloaded)
+    peak_utilization = _run_max(utilization, line_index, run_start, run_stop)
+    peak_backlog = _run_max(backlog, line_index, run_start, run_stop)
+    intervals = pd.DataFrame({
+        'Linea': [lines[line] for line in line_index],
+        'Dal': [starts[start] for start in run_start],
+        'Al': [ends[stop - 1] for stop in run_stop],
+        'Periodi': run_stop - run_start,
+        'Picco Utilizzo %': (100 * peak_utilization).round(0),
+        'Arretrato Max (ore)': (peak_backlog / 60).round(1),
+    })
+
+    overloaded_any = overloaded.any(axis=1)
+    first = np.argmax(overloaded, axis=1)
+    lines_summary = pd.DataFrame({
+        'Linea': lines,
+        'Utilizzo Medio %': (100 * required.sum(axis=1) / capacity.sum()).round(0),
+        'Periodi Sovraccarichi': overloaded.sum(axis=1),
+        'Primo Sovraccarico': [starts[index] if flag else None for index, flag in zip(first, overloaded_any)],
+        'Arretrato Finale (ore)': (backlog[:, -1] / 60).round(1),
+        'Ore Oltre Orizzonte': (beyond / 60).round(1),
+    })
+
+    return {
+        'lines': lines,
+        'bucket_starts': starts,
+        'bucket_ends': ends,
+        'capacity': capacity,
+        'required': required,
+        'scheduled': scheduled,
+        'utilization': utilization,
+        'backlog': backlog,
+        'overloaded': overloaded,
+        'intervals': intervals,
+        'summary': lines_summary,
+    }
+
+
+def heatmap_frame(profile, measure='Utilizzo %'):
+    # Griglia linee x periodi gia' aggregata: il grafico riceve una cella per periodo, non una riga per ordine
+    values = profile[PROFILE_MEASURES[measure]]
+    if measure == 'Utilizzo %':
+        values = 100 * values
+    else:
+        values = values / 60
+    return pd.DataFrame(
+        values.round(1),
+        index=pd.Index(profile['lines'], name='Linea'),
+        columns=[start.strftime('%d/%m/%Y') for start in profile['bucket_starts']],
+    )
@@ -0,0 +1,156 @@
+"""Generazione notturna dei report di pianificazione senza interfaccia Streamlit.
+
+Esempio: python -m planner export/*.xlsx --output-dir report --workers 4
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from planner.export import create_excel_download
+from planner.ingestion import SUPPORTED_FORMATS, detect_format, read_production_file
+from planner.pipeline import REPORTS, build_reports
+from planner.scheduling import DEFAULT_WORKING_HOURS
+
+TIMING_FIELDS = [
+    'file', 'esito', 'righe', 'lettura_s', 'sequence_s', 'schedule_s', 'work_orders_s',
+    'dashboard_s', 'delivery_s', 'export_s', 'totale_s', 'messaggio'
+]
+
+
+def expand_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = sorted(os.path.join(item, name) for name in os.listdir(item))
+        else:
+            candidates = sorted(glob.glob(item)) or [item]
+        paths.extend(path for path in candidates if os.path.isfile(path) and detect_format(path))
+    # Stesso file indicato due volte (es. directory e glob) elaborato una sola volta
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+def _stem_candidates(path):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    parent = os.path.basename(os.path.dirname(path))
+    extension = extension.lstrip('.').lower()
+    return [stem, f"{stem}_{extension}", f"{parent}_{stem}_{extension}"]
+
+
+def output_stems(paths):
+    # Nome base dei report per ogni file: il solo nome se e' unico, altrimenti con il formato
+    # e poi con la cartella (a.xlsx + a.csv, plantX/export.xlsx + plantY/export.xlsx)
+    candidates = {path: _stem_candidates(path) for path in paths}
+    stems = {}
+    for level in range(3):
+        pending = [path for path in paths if path not in stems]
+        counts = {}
+        for path in pending:
+            counts[candidates[path][level]] = counts.get(candidates[path][level], 0) + 1
+        taken = set(stems.values())
+        for path in pending:
+            stem = candidates[path][level]
+            if counts[stem] == 1 and stem not in taken:
+                stems[path] = stem
+    clashes = [path for path in paths if path not in stems]
+    if clashes:
+        raise ValueError(f"Nomi dei report in conflitto per: {', '.join(clashes)}")
+    return stems
+
+
+def process_file(path, output_dir, working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None,
+                 sequence_budget=None, stem=None):
+    started = time.perf_counter()
+    row = {field: '' for field in TIMING_FIELDS}
+    row['file'] = os.path.basename(path)
+    try:
+        with open(path, 'rb') as handle:
+            file_bytes = handle.read()
+        df, message, _, _, ingest_stats = read_production_file(file_bytes, path)
+        row['lettura_s'] = round(time.perf_counter() - started, 3)
+        if df is None:
+            row.update(esito='ERRORE', messaggio=message)
+            return row
+        row['righe'] = len(df)
+
+        timings = {}
+        reports = build_reports(df, working_hours_per_day, reference_time, timings, sequence_budget)
+        for stage, seconds in timings.items():
+            row[f'{stage}_s'] = round(seconds, 3)
+
+        export_started = time.perf_counter()
+        if stem is None:
+            stem = os.path.splitext(os.path.basename(path))[0]
+        for sheet_name, suffix in REPORTS:
+            output_path = os.path.join(output_dir, f"{stem}_{suffix}.xlsx")
+            with open(output_path, 'wb') as handle:
+                handle.write(create_excel_download(reports[sheet_name], sheet_name).getbuffer())
+        row['export_s'] = round(time.perf_counter() - export_started, 3)
+        row.update(esito='OK', messaggio=message)
+    except Exception as e:
+        row.update(esito='ERRORE', messaggio=str(e))
+    finally:
+        row['totale_s'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def write_timing_summary(rows, output_dir):
+    summary_path = os.path.join(output_dir, f"riepilogo_tempi_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+    with open(summary_path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.DictWriter(handle, fieldnames=TIMING_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return summary_path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m planner',
+        description="Genera Ordini_Lavoro, Dashboard e Stime_Consegna per ogni export di produzione."
+    )
+    parser.add_argument('inputs', nargs='+', help=f"file, directory o glob ({', '.join(SUPPORTED_FORMATS)})")
+    parser.add_argument('-o', '--output-dir', default='report', help="directory dei report (default: report)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="processi in parallelo")
+    parser.add_argument('--working-hours', type=float, default=DEFAULT_WORKING_HOURS, help="ore lavorative giornaliere")
+    parser.add_argument('--ottimizza', type=float, metavar='SECONDI',
+                        help="ordina le code con la sequenza ottimizzata, entro SECONDI per file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("Nessun file da elaborare.", file=sys.stderr)
+        return 2
+    try:
+        stems = output_stems(paths)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Stesso istante di riferimento per tutti gli stabilimenti della stessa esecuzione
+    reference_time = datetime.now()
+    workers = max(1, min(args.workers or 1, len(paths)))
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                process_file, path, args.output_dir, args.working_hours, reference_time, args.ottimizza, stems[path]
+            )
+            for path in paths
+        ]
+        rows = []
+        for future in futures:
+            row = future.result()
+            rows.append(row)
+            print(f"{row['esito']:<7} {row['file']:<40} {row['righe'] or '-':>9} righe  {row['totale_s']:>8.2f} s  {row['messaggio'] if row['esito'] != 'OK' else ''}")
+
+    summary_path = write_timing_summary(rows, args.output_dir)
+    print(f"{len(rows)} file in {time.perf_counter() - started:.2f} s con {workers} processi. Riepilogo: {summary_path}")
+    return 0 if all(row['esito'] == 'OK' for row in rows) else 1
@@ -0,0 +1,403 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from planner.scheduling import DEFAULT_WORKING_HOURS, minutes_to_days
+
+DEFAULT_SCENARIOS = 10_000
+
+CONFIDENCE_LEVELS = [0.50, 0.80, 0.95]
+CONFIDENCE_LABELS = ['P50', 'P80', 'P95']
+
+# Livello usato per le date di impegno verso il cliente
+COMMITMENT_LABEL = 'P80'
+
+# Variabilita' di default, usata finche' lo storico non permette di stimarla:
+# scarto relativo dei minuti del singolo ordine, scarto relativo della resa di linea
+# (stessa per tutta la coda in uno scenario), fermi per ora di lavoro della linea (0.1 al
+# giorno su 8 ore) e loro durata media. Tutto in minuti di linea: le ore giornaliere servono
+# solo a convertire in giorni
+PROCESSING_CV = 0.25
+LINE_FACTOR_CV = 0.10
+STOPPAGES_PER_WORK_HOUR = 0.0125
+STOPPAGE_MEAN_HOURS = 4
+STOPPAGE_NORMAL_MIN_EVENTS = 1
+
+# Punti della coda simulati per linea (piu' fitti all'inizio, dove l'incertezza relativa e' maggiore)
+CHECKPOINTS_PER_LINE = 12
+
+# Celle linee x punti x scenari simulate insieme: oltre si procede a blocchi di linee per non
+# tenere in memoria tutti i percorsi (2^23 celle float32 = 32 MB per matrice)
+SIMULATION_BLOCK_CELLS = 2 ** 23
+
+# Quantili conservati per ogni punto simulato, minimo e massimo compresi. La coda alta e' piu' fitta:
+# un cliente servito da molte linee arriva al P95 solo se ciascuna e' molto vicina al proprio massimo
+TABLE_LEVELS = np.concatenate([[0.0], np.linspace(0.005, 0.995, 199), 1 - np.geomspace(0.004, 0.0001, 12), [1.0]])
+
+# Griglia su cui si combinano le linee di un cliente, e coppie cliente-linea per blocco
+CLIENT_GRID_POINTS = 128
+CLIENT_PAIRS_CHUNK = 4_096
+
+# Coppie di snapshot necessarie per stimare media e dispersione della resa di una linea
+FIT_MIN_OBSERVATIONS = 2
+FIT_FACTOR_RANGE = (0.2, 5.0)
+
+
+def _level_columns():
+    return np.abs(TABLE_LEVELS[:, None] - np.asarray(CONFIDENCE_LEVELS)[None, :]).argmin(axis=0)
+
+
+def _lognormal_params(mean, cv):
+    sigma2 = np.log1p(np.square(cv))
+    return np.log(mean) - sigma2 / 2, np.sqrt(sigma2)
+
+
+def _snapshot_pairs(snapshots):
+    # Coppie consecutive solo tra caricamenti della stessa origine: confrontare due stabilimenti
+    # diversi darebbe per prodotti tutti i minuti del primo
+    by_source = {}
+    for source, snapshot_date, frame in snapshots:
+        by_source.setdefault(source, []).append((snapshot_date, frame))
+    for source_snapshots in by_source.values():
+        source_snapshots.sort(key=lambda item: item[0])
+        yield from zip(source_snapshots, source_snapshots[1:])
+
+
+def fit_line_factors(snapshots, working_hours_per_day=DEFAULT_WORKING_HOURS):
+    # snapshots: lista di (origine, data, frame). Per ogni coppia consecutiva della stessa origine,
+    # minuti di capacita' del periodo diviso minuti effettivamente smaltiti dalla linea: > 1 se la
+    # coda scorre piu' lenta del previsto
+    records = []
+    for (old_date, old_df), (new_date, new_df) in _snapshot_pairs(snapshots):
+        days = (pd.Timestamp(new_date) - pd.Timestamp(old_date)).days
+        if days <= 0:
+            continue
+        remaining = pd.Series(
+            new_df['min_prd'].to_numpy(dtype='float64'), index=new_df['ID_Cartellino'].astype(str).to_numpy()
+        )
+        remaining = remaining[~remaining.index.duplicated(keep='last')]
+        old_keys = old_df['ID_Cartellino'].astype(str).to_numpy()
+        produced = np.clip(
+            old_df['min_prd'].to_numpy(dtype='float64') - remaining.reindex(old_keys).fillna(0).to_numpy(), 0, None
+        )
+        by_line = pd.Series(produced).groupby(old_df['Linea'].astype(str).to_numpy()).sum()
+        by_line = by_line[by_line > 0]
+        capacity = days * working_hours_per_day * 60
+        records.append(pd.DataFrame({
+            'Linea': by_line.index,
+            'Fattore': np.clip(capacity / by_line.to_numpy(), *FIT_FACTOR_RANGE),
+        }))
+
+    columns = ['Linea', 'Osservazioni', 'Fattore Medio', 'CV']
+    if not records:
+        return pd.DataFrame(columns=columns)
+    observations = pd.concat(records, ignore_index=True)
+    fitted = observations.groupby('Linea')['Fattore'].agg(['size', 'mean', 'std']).reset_index()
+    fitted.columns = columns
+    fitted['CV'] = (fitted['CV'] / fitted['Fattore Medio']).fillna(0)
+    return fitted
+
+
+def line_parameters(lines, fitted=None):
+    # Media e dispersione della resa per linea: stima propria con abbastanza osservazioni,
+    # altrimenti quella complessiva dello storico, altrimenti i valori di default
+    parameters = pd.DataFrame({'Fattore Medio': 1.0, 'CV': LINE_FACTOR_CV}, index=pd.Index(lines, name='Linea'))
+    if fitted is None or len(fitted) == 0:
+        return parameters
+    fitted = fitted.set_index('Linea')
+    if fitted['Osservazioni'].sum() >= FIT_MIN_OBSERVATIONS:
+        pooled_mean = np.average(fitted['Fattore Medio'], weights=fitted['Osservazioni'])
+        pooled_cv = np.average(fitted['CV'], weights=fitted['Osservazioni'])
+        parameters['Fattore Medio'] = pooled_mean
+        parameters['CV'] = max(pooled_cv, 0.0)
+    own = fitted[fitted['Osservazioni'] >= FIT_MIN_OBSERVATIONS].reindex(parameters.index).dropna()
+    parameters.loc[own.index, ['Fattore Medio', 'CV']] = own[['Fattore Medio', 'CV']].to_numpy()
+    return parameters
+
+
+def _checkpoint_grid(line_sizes):
+    # Punti di controllo di tutte le linee su una griglia regolare, piu' fitti all'inizio della coda.
+    # Le linee con meno ordini ripetono l'ultimo punto: un punto ripetuto ha incremento nullo
+    sizes = np.asarray(line_sizes, dtype='float64')[:, None]
+    width = int(min(CHECKPOINTS_PER_LINE, sizes.max()))
+    steps = np.maximum(np.minimum(sizes, width) - 1, 1)
+    positions = np.round(sizes ** np.minimum(np.arange(width)[None, :] / steps, 1)).astype('int64') - 1
+    positions[:, -1] = sizes[:, 0] - 1
+    return positions
+
+
+def _simulate_lines(rng, interval, interval_sq, factor_mean, factor_cv, scenarios):
+    # Percorsi di un blocco di linee, valutati solo nei punti di controllo: tra due punti i minuti
+    # degli ordini si sommano in un unico incremento lognormale con la stessa media e varianza
+    # della somma. interval: minuti nominali tra punti, una riga per linea
+    positive = interval > 0
+    sigma2 = np.log1p(np.divide(
+        PROCESSING_CV ** 2 * interval_sq, np.square(interval), out=np.zeros(interval.shape), where=positive
+    ))
+    mu, line_sigma = _lognormal_params(factor_mean, factor_cv)
+    factor = rng.standard_normal((len(interval), scenarios), dtype=np.float32)
+    factor *= line_sigma.astype(np.float32)[:, None]
+    factor += mu.astype(np.float32)[:, None]
+    np.exp(factor, out=factor)
+    inverse_factor = np.reciprocal(factor)
+
+    # Fermi: processo di Poisson lungo il lavoro in coda, durate esponenziali. La resa di linea
+    # moltiplica solo la lavorazione: i fermi si sommano agli incrementi divisi per la resa, cosi'
+    # basta una cumulata sola. Negli intervalli con molti fermi attesi lavorazione e fermi formano un
+    # unico incremento lognormale con la stessa media e varianza della somma, negli altri si
+    # campionano i singoli eventi
+    mean_duration = STOPPAGE_MEAN_HOURS * 60
+    expected = STOPPAGES_PER_WORK_HOUR / 60 * interval
+    approx = expected >= STOPPAGE_NORMAL_MIN_EVENTS
+    path = rng.standard_normal(interval.shape + (scenarios,), dtype=np.float32)
+    if approx.any():
+        scale = inverse_factor[np.nonzero(approx)[0]]
+        mean = (expected[approx] * mean_duration).astype(np.float32)[:, None] * scale
+        variance = (2 * expected[approx] * mean_duration ** 2).astype(np.float32)[:, None] * np.square(scale)
+        mean += interval[approx].astype(np.float32)[:, None]
+        variance += (PROCESSING_CV ** 2 * interval_sq[approx]).astype(np.float32)[:, None]
+        approx_sigma2 = np.log1p(variance / np.square(mean))
+        combined = path[approx]
+        combined *= np.sqrt(approx_sigma2)
+        combined += np.log(mean)
+        combined -= approx_sigma2 / 2
+    path *= np.sqrt(sigma2).astype(np.float32)[:, :, None]
+    path += (np.log(np.where(positive, interval, 1.0)) - sigma2 / 2).astype(np.float32)[:, :, None]
+    np.exp(path, out=path)
+    path[~positive] = 0
+    if approx.any():
+        path[approx] = np.exp(combined, out=combined)
+
+    exact_expected = np.where(approx, 0.0, expected)
+    line_expected = exact_expected.sum(axis=1)
+    if line_expected.sum() > 0:
+        n_lines, width = interval.shape
+        counts = rng.poisson(np.repeat(line_expected, scenarios))
+        cell = np.repeat(np.arange(n_lines * scenarios), counts)
+        line, scenario = np.divmod(cell, scenarios)
+        # Punto di controllo di ogni evento: le cumulate normalizzate delle linee sono affiancate
+        # sull'asse [0, n_lines), la linea i occupa [i, i + 1]
+        cumulative = np.divide(
+            np.cumsum(exact_expected, axis=1), line_expected[:, None],
+            out=np.ones(interval.shape), where=line_expected[:, None] > 0
+        ) + np.arange(n_lines)[:, None]
+        bucket = np.searchsorted(cumulative.ravel(), line + rng.random(len(cell)), side='right')
+        bucket = np.minimum(bucket, line * width + width - 1)
+        duration = rng.standard_exponential(len(cell), dtype=np.float32) * mean_duration
+        np.add.at(path.reshape(-1), bucket * scenarios + scenario, duration * inverse_factor[line, scenario])
+
+    np.cumsum(path, axis=1, out=path)
+    path *= factor[:, None, :]
+    return path
+
+
+def _interpolate_rows(nominal, table, finish):
+    # Tra i punti simulati si interpola il rapporto tra quantile e fine nominale: una riga di
+    # quantili per ogni valore di finish
+    ratios = np.divide(table, nominal[:, None], out=np.ones_like(table), where=nominal[:, None] > 0)
+    upper = np.clip(np.searchsorted(nominal, finish, side='left'), 0, len(nominal) - 1)
+    lower = np.maximum(upper - 1, 0)
+    span = nominal[upper] - nominal[lower]
+    weight = np.clip(np.divide(finish - nominal[lower], span, out=np.ones(len(span)), where=span > 0), 0, 1)
+    return finish[:, None] * (ratios[lower] * (1 - weight[:, None]) + ratios[upper] * weight[:, None])
+
+
+def _grid_cdf(tables, low, step):
+    # Probabilita' cumulata di ogni riga di tables (quantili ai TABLE_LEVELS) nei punti
+    # low + j * step della sua griglia. I punti sono equispaziati: quanti quantili stanno sotto
+    # ogni punto si conta con un bincount invece di cercarlo riga per riga
+    n_rows, n_levels = tables.shape
+    bins = np.ceil((tables - low[:, None]) / step[:, None])
+    bins = np.clip(bins, 0, CLIENT_GRID_POINTS).astype('int64') + np.arange(n_rows)[:, None] * (CLIENT_GRID_POINTS + 1)
+    below = np.bincount(bins.ravel(), minlength=n_rows * (CLIENT_GRID_POINTS + 1))
+    below = np.cumsum(below.reshape(n_rows, CLIENT_GRID_POINTS + 1)[:, :-1], axis=1)
+    upper = np.clip(below, 1, n_levels - 1)
+    lower = upper - 1
+    row_start = np.arange(n_rows)[:, None] * n_levels
+    flat = tables.ravel()
+    x_lower, x_upper = flat[row_start + lower], flat[row_start + upper]
+    x = low[:, None] + step[:, None] * np.arange(CLIENT_GRID_POINTS)[None, :]
+    width = x_upper - x_lower
+    weight = np.clip(np.divide(x - x_lower, width, out=np.ones(x.shape), where=width > 0), 0, 1)
+    return TABLE_LEVELS[lower] + weight * (TABLE_LEVELS[upper] - TABLE_LEVELS[lower])
+
+
+def _client_quantiles(pair_clients, pair_tables, n_clients):
+    # Le linee sono indipendenti: la probabilita' che tutte le linee di un cliente abbiano finito
+    # entro x e' il prodotto delle probabilita' delle singole linee, calcolato su una griglia di x
+    order = np.argsort(pair_clients, kind='stable')
+    pair_clients, pair_tables = pair_clients[order], pair_tables[order]
+    firsts = np.flatnonzero(np.r_[True, pair_clients[1:] != pair_clients[:-1]])
+    # La griglia parte dal piu' alto tra i quantili minimi richiesti delle singole linee
+    low = np.maximum.reduceat(pair_tables[:, _level_columns().min()], firsts)
+    high = np.maximum.reduceat(pair_tables[:, -1], firsts)
+    step = np.maximum(high - low, 1e-9) / (CLIENT_GRID_POINTS - 1)
+    grid = low[:, None] + step[:, None] * np.arange(CLIENT_GRID_POINTS)[None, :]
+
+    # Una linea che in ogni scenario finisce prima dell'inizio della griglia ha probabilita' 1
+    # su tutta la griglia: non serve valutarla
+    group = np.repeat(np.arange(len(firsts)), np.diff(np.r_[firsts, len(pair_clients)]))
+    relevant = pair_tables[:, -1] > low[group]
+    group, pair_tables = group[relevant], pair_tables[relevant]
+
+    log_cdf = np.zeros((len(firsts), CLIENT_GRID_POINTS))
+    for chunk in range(0, len(group), CLIENT_PAIRS_CHUNK):
+        rows = slice(chunk, chunk + CLIENT_PAIRS_CHUNK)
+        chunk_groups = group[rows]
+        cdf = _grid_cdf(pair_tables[rows], low[chunk_groups], step[chunk_groups])
+        starts = np.flatnonzero(np.r_[True, chunk_groups[1:] != chunk_groups[:-1]])
+        log_cdf[chunk_groups[starts]] += np.add.reduceat(np.log(np.maximum(cdf, 1e-12)), starts, axis=0)
+    cdf = np.exp(log_cdf)
+
+    quantiles = np.empty((len(firsts), len(CONFIDENCE_LEVELS)))
+    for level, probability in enumerate(CONFIDENCE_LEVELS):
+        above = np.clip((cdf < probability).sum(axis=1), 1, CLIENT_GRID_POINTS - 1)
+        rows = np.arange(len(firsts))
+        cdf_low, cdf_high = cdf[rows, above - 1], cdf[rows, above]
+        weight = np.clip(np.divide(probability - cdf_low, cdf_high - cdf_low,
+                                   out=np.ones(len(rows)), where=cdf_high > cdf_low), 0, 1)
+        quantiles[:, level] = grid[rows, above - 1] + weight * (grid[rows, above] - grid[rows, above - 1])
+
+    client_minutes = np.zeros((n_clients, len(CONFIDENCE_LEVELS)))
+    client_minutes[pair_clients[firsts]] = quantiles
+    return client_minutes
+
+
+def simulate_completion(df, schedule, scenarios=DEFAULT_SCENARIOS, fitted=None, seed=0):
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    rows = schedule['row'].to_numpy()
+    linee = schedule['Linea'].astype(str).to_numpy()
+    minutes = np.clip(schedule['finish_min'].to_numpy() - schedule['start_min'].to_numpy(), 0, None)
+    clients, client_names = pd.factorize(df['Cliente'].astype(str).to_numpy()[rows])
+    if len(schedule) == 0:
+        return {
+            'order_minutes': np.zeros((0, len(CONFIDENCE_LEVELS))),
+            'client_names': client_names,
+            'client_minutes': np.zeros((0, len(CONFIDENCE_LEVELS))),
+            'line_curves': {},
+            'parameters': line_parameters([], fitted),
+            'scenarios': scenarios,
+            'seconds': time.perf_counter() - started,
+        }
+
+    # Le linee sono tratti contigui del piano: ogni ordine ha la sua linea e la sua fine nominale
+    # misurata dall'inizio della coda di quella linea
+    line_names, line_starts = np.unique(linee, return_index=True)
+    by_start = np.argsort(line_starts)
+    line_names, line_starts = line_names[by_start], line_starts[by_start]
+    line_sizes = np.diff(np.r_[line_starts, len(schedule)])
+    row_line = np.repeat(np.arange(len(line_names)), line_sizes)
+    cumulative = np.cumsum(minutes)
+    line_base = cumulative[line_starts] - minutes[line_starts]
+    finish = cumulative - line_base[row_line]
+    cumulative_sq = np.cumsum(np.square(minutes))
+    line_base_sq = cumulative_sq[line_starts] - np.square(minutes[line_starts])
+
+    # Griglia linee x punti di controllo: fine nominale in ogni punto e minuti tra un punto e il precedente
+    checkpoint_rows = line_starts[:, None] + _checkpoint_grid(line_sizes)
+    nominal = cumulative[checkpoint_rows] - line_base[:, None]
+    interval = np.diff(nominal, axis=1, prepend=0.0)
+    interval_sq = np.diff(cumulative_sq[checkpoint_rows] - line_base_sq[:, None], axis=1, prepend=0.0)
+    parameters = line_parameters(line_names, fitted)
+    factor_mean = parameters['Fattore Medio'].to_numpy(dtype='float64')
+    factor_cv = parameters['CV'].to_numpy(dtype='float64')
+
+    # Tutte le linee di un blocco in un'unica estrazione; i blocchi limitano solo la memoria.
+    # Di ogni punto simulato si conserva la distribuzione empirica ridotta a una tabella di quantili
+    n_lines, width = nominal.shape
+    table_columns = np.round(TABLE_LEVELS * (scenarios - 1)).astype('int64')
+    tables = np.empty((n_lines, width, len(TABLE_LEVELS)))
+    block = max(1, SIMULATION_BLOCK_CELLS // (width * scenarios))
+    for first in range(0, n_lines, block):
+        lines = slice(first, first + block)
+        path = _simulate_lines(
+            rng, interval[lines], interval_sq[lines], factor_mean[lines], factor_cv[lines], scenarios
+        )
+        path.sort(axis=2)
+        tables[lines] = path[:, :, table_columns]
+
+    # Quantili di ogni ordine interpolati in un colpo solo: il punto di controllo superiore e' il primo
+    # che non precede la riga, l'inferiore il precedente sulla stessa linea
+    upper = np.searchsorted(checkpoint_rows.ravel(), np.arange(len(schedule)), side='left')
+    lower = np.where(upper % width == 0, upper, upper - 1)
+    flat_nominal = nominal.ravel()
+    flat_tables = tables.reshape(n_lines * width, len(TABLE_LEVELS))
+    ratios = np.divide(flat_tables, flat_nominal[:, None], out=np.ones_like(flat_tables),
+                       where=flat_nominal[:, None] > 0)
+    span = flat_nominal[upper] - flat_nominal[lower]
+    weight = np.clip(np.divide(finish - flat_nominal[lower], span, out=np.ones(len(span)), where=span > 0), 0, 1)
+
+    def interpolate(positions, columns):
+        selected = ratios[:, columns]
+        low, high = selected[lower[positions]], selected[upper[positions]]
+        share = weight[positions, None]
+        return finish[positions, None] * (low * (1 - share) + high * share)
+
+    order_minutes = interpolate(np.arange(len(schedule)), _level_columns())
+
+    # Per la consegna al cliente conta solo il suo ultimo ordine su ciascuna linea. Ogni quantile del
+    # cliente e' almeno lo stesso quantile della sua linea peggiore: una linea che finisce sempre prima
+    # di quella soglia non sposta la consegna e non serve la sua tabella completa
+    pair_keys = row_line * len(client_names) + clients
+    last_positions = len(pair_keys) - 1 - np.unique(pair_keys[::-1], return_index=True)[1]
+    pair_clients = clients[last_positions]
+    bounds = interpolate(last_positions, [_level_columns().min(), len(TABLE_LEVELS) - 1])
+    floor = np.zeros(len(client_names))
+    np.maximum.at(floor, pair_clients, bounds[:, 0])
+    relevant = bounds[:, 1] >= floor[pair_clients]
+    client_minutes = _client_quantiles(
+        pair_clients[relevant], interpolate(last_positions[relevant], slice(None)), len(client_names)
+    )
+
+    by_row = np.empty_like(order_minutes)
+    by_row[rows] = order_minutes
+    return {
+        'order_minutes': by_row,
+        'client_names': client_names,
+        'client_minutes': client_minutes,
+        'line_curves': {linea: (nominal[line], tables[line]) for line, linea in enumerate(line_names)},
+        'parameters': parameters,
+        'scenarios': scenarios,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def _dates(reference_time, days):
+    return (pd.Timestamp(reference_time) + pd.to_timedelta(days, unit='D')).strftime('%d/%m/%Y').to_numpy()
+
+
+def order_confidence(model, working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None):
+    if reference_time is None:
+        reference_time = datetime.now()
+    days = minutes_to_days(model['order_minutes'], working_hours_per_day)
+    columns = {}
+    for level, label in enumerate(CONFIDENCE_LABELS):
+        columns[f"Giorni {label}"] = days[:, level].round(1)
+    for level, label in enumerate(CONFIDENCE_LABELS):
+        columns[f"Consegna {label}"] = _dates(reference_time, days[:, level])
+    return pd.DataFrame(columns)
+
+
+def client_confidence(model, working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None):
+    if reference_time is None:
+        reference_time = datetime.now()
+    days = minutes_to_days(model['client_minutes'], working_hours_per_day)
+    clients = pd.DataFrame({'Cliente': model['client_names']})
+    for level, label in enumerate(CONFIDENCE_LABELS):
+        clients[f"Giorni {label}"] = days[:, level].round(1)
+    for level, label in enumerate(CONFIDENCE_LABELS):
+        clients[f"Consegna {label}"] = _dates(reference_time, days[:, level])
+    return clients
+
+
+def completion_quantiles(model, linea, nominal_minutes):
+    # Quantili di un ordine ipotetico che finirebbe a nominal_minutes sulla linea
+    curve = model['line_curves'].get(linea)
+    if curve is None:
+        return None
+    nominal, table = curve
+    level_columns = _level_columns()
+    return _interpolate_rows(nominal, table[:, level_columns], np.atleast_1d(np.asarray(nominal_minutes, dtype='float64')))
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from planner.priority import get_priority_statuses
+from planner.scheduling import build_line_schedule, minutes_to_days, schedule_by_row
+
+MICROSECONDS_PER_DAY = 86_400_000_000
+
+
+def _format_dates(timestamps, date_format='%d/%m/%Y'):
+    # Le date distinte sono poche: si formatta una volta per giorno invece che per riga
+    codes, unique_days = pd.factorize(timestamps.dt.normalize())
+    labels = pd.DatetimeIndex(unique_days).strftime(date_format).to_numpy(dtype=object)
+    return labels[codes]
+
+
+def _days_to_offsets(days):
+    # timedelta(days=x) arrotonda al microsecondo: stesso arrotondamento della versione per riga
+    return pd.to_timedelta(np.round(days * MICROSECONDS_PER_DAY).astype('int64'), unit='us')
+
+
+def build_delivery_estimates(df, working_hours_per_day=8, reference_time=None, schedule=None):
+    if reference_time is None:
+        reference_time = datetime.now()
+    reference_time = pd.Timestamp(reference_time)
+    if schedule is None:
+        schedule = build_line_schedule(df)
+
+    delay = df['ritardo_cartellino'].to_numpy(dtype='float64')
+    start_days = minutes_to_days(schedule_by_row(schedule, 'start_min'), working_hours_per_day)
+    finish_days = minutes_to_days(schedule_by_row(schedule, 'finish_min'), working_hours_per_day)
+
+    offsets = _days_to_offsets(finish_days)
+    completion = pd.Series(reference_time + offsets)
+    start = pd.Series(reference_time + _days_to_offsets(start_days))
+
+    delivery_df = pd.DataFrame({
+        'ID': df['ID_Cartellino'].array,
+        'Cliente': df['Cliente'].array,
+        'Articolo': df['Articolo'].array,
+        'Linea': df['Linea'].array,
+        'Minuti Produzione': df['min_prd'].array,
+        'Ritardo Attuale': df['ritardo_cartellino'].array,
+        'Posizione in Coda': schedule_by_row(schedule, 'queue_position'),
+        'Data Inizio Stimata': _format_dates(start),
+        'Data Completamento Stimata': _format_dates(completion),
+        'Giorni al Completamento': offsets.days.to_numpy(),
+        'Priorità': get_priority_statuses(delay),
+    })
+    return delivery_df.sort_values('Giorni al Completamento', ascending=False)
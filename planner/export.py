@@ -0,0 +1,72 @@
+import hashlib
+from io import BytesIO
+
+import pandas as pd
+import xlsxwriter
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Oltre questa soglia xlsxwriter scrive le righe su file temporanei invece di tenerle in memoria
+CONSTANT_MEMORY_MIN_ROWS = 50_000
+
+# Righe campionate per stimare la larghezza delle colonne
+WIDTH_SAMPLE_ROWS = 2_000
+
+WRITE_CHUNK_ROWS = 10_000
+
+MAX_COLUMN_WIDTH = 30
+
+
+def frame_content_hash(df):
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(repr(list(df.columns)).encode())
+    return digest.hexdigest()
+
+
+def estimate_column_widths(df, sample_rows=WIDTH_SAMPLE_ROWS):
+    if len(df) > sample_rows:
+        # Prime righe (le piu' prioritarie negli export ordinati) piu' un campione casuale
+        sample = pd.concat([df.head(sample_rows // 2), df.sample(sample_rows // 2, random_state=0)])
+    else:
+        sample = df
+
+    widths = []
+    for col in df.columns:
+        col_max_len = sample[col].astype(str).str.len().max() if len(sample) > 0 else 0
+        max_len = max(col_max_len, len(str(col))) + 2
+        widths.append(min(max_len, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def _cell_rows(df):
+    for start in range(0, len(df), WRITE_CHUNK_ROWS):
+        chunk = df.iloc[start:start + WRITE_CHUNK_ROWS].astype(object)
+        # NaN/NA diventano celle vuote come in DataFrame.to_excel
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.to_numpy().tolist()
+
+
+def create_excel_download(df, sheet_name="Dati"):
+    output = BytesIO()
+    options = {'constant_memory': len(df) >= CONSTANT_MEMORY_MIN_ROWS}
+    workbook = xlsxwriter.Workbook(output, options)
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#1E3A5F',
+        'font_color': 'white',
+        'border': 1
+    })
+
+    if not df.empty:
+        for col_num, width in enumerate(estimate_column_widths(df)):
+            worksheet.set_column(col_num, col_num, width)
+    # In modalita' constant_memory le righe vanno scritte in ordine, intestazione compresa
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+    for row_num, values in enumerate(_cell_rows(df), start=1):
+        worksheet.write_row(row_num, 0, values)
+
+    workbook.close()
+    output.seek(0)
+    return output
@@ -0,0 +1,178 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from planner.estimates import build_delivery_estimates
+from planner.scheduling import DEFAULT_WORKING_HOURS
+from planner.summaries import client_summary_from_totals, client_totals, line_summary_from_totals, line_totals
+
+KEY_COLUMN = '_key'
+
+
+def _keys(series):
+    # Chiave testuale: delta e file completo possono leggere gli ID con tipi diversi
+    return series.astype(str).to_numpy(dtype=object)
+
+
+def delta_deletions(delta_df):
+    # Nel file delta una riga senza saldo e senza minuti residui chiude il cartellino
+    minutes = delta_df['min_prd'].to_numpy(dtype='float64')
+    quantity = delta_df['M24_QT_SALDO'].to_numpy(dtype='float64')
+    return (minutes <= 0) & (quantity <= 0)
+
+
+def _subtract(totals, contribution):
+    updated = totals.sub(contribution, fill_value=0)
+    return updated[updated['N. Ordini'] > 0]
+
+
+def _add(totals, contribution):
+    return totals.add(contribution, fill_value=0)
+
+
+def _queue_minutes(df):
+    # Come nel piano completo: le righe con minuti negativi non occupano la linea
+    minutes = np.clip(df['min_prd'].to_numpy(dtype='float64'), 0, None)
+    return pd.Series(minutes).groupby(df['Linea'].astype(str).to_numpy()).sum()
+
+
+def _estimate_lines(state, frames):
+    # Una sola stima per tutte le linee da ricalcolare, poi ripartita per linea
+    estimates = build_delivery_estimates(
+        pd.concat(frames, ignore_index=True), state['working_hours_per_day'], state['reference_time']
+    )
+    linee = estimates['Linea'].astype(str)
+    for linea, line_estimates in estimates.groupby(linee, observed=True, sort=False):
+        state['line_estimates'][linea] = line_estimates
+    max_days = estimates.groupby([linee, estimates['Cliente'].astype(str)], observed=True)['Giorni al Completamento'].max()
+    for linea, client_days in max_days.groupby(level=0, sort=False):
+        state['client_max_days'][linea] = client_days.droplevel(0)
+
+
+def build_incremental_state(df, working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None):
+    if reference_time is None:
+        reference_time = datetime.now()
+    df = df.assign(**{KEY_COLUMN: _keys(df['ID_Cartellino'])}).drop_duplicates(KEY_COLUMN, keep='last')
+    linee = df['Linea'].astype(str)
+
+    state = {
+        'working_hours_per_day': working_hours_per_day,
+        # Riferimento fisso: le linee stimate in momenti diversi restano confrontabili
+        'reference_time': reference_time,
+        # Frame vuoto con le stesse colonne, per quando un delta chiude tutti i cartellini
+        'empty_frame': df.iloc[:0],
+        'line_frames': {},
+        'line_estimates': {},
+        'client_max_days': {},
+        'id_line': dict(zip(df[KEY_COLUMN].tolist(), linee.tolist())),
+        'line_totals': line_totals(df),
+        'queue_minutes': _queue_minutes(df),
+        'client_totals': client_totals(df),
+        'applied_deltas': 0,
+    }
+    for linea, frame in df.groupby(linee, observed=True, sort=False):
+        state['line_frames'][linea] = frame
+    if len(df) > 0:
+        _estimate_lines(state, [df])
+    return state
+
+
+def apply_delta(state, delta_df):
+    # Lo stato viene aggiornato sul posto: il costo dipende dalle righe del delta
+    # e dalle sole linee che queste toccano, non dall'intero portafoglio ordini
+    delta = delta_df.assign(**{KEY_COLUMN: _keys(delta_df['ID_Cartellino'])})
+    delta = delta.drop_duplicates(KEY_COLUMN, keep='last')
+    deletes = delta_deletions(delta)
+    upserts = delta[~deletes]
+    delta_keys = delta[KEY_COLUMN].to_numpy()
+
+    id_line = state['id_line']
+    known = np.array([key in id_line for key in delta_keys], dtype=bool)
+    keys_by_line = {}
+    for key in delta_keys[known]:
+        keys_by_line.setdefault(id_line[key], []).append(key)
+    old_lines = set(keys_by_line)
+
+    removed = []
+    for linea, line_keys in keys_by_line.items():
+        frame = state['line_frames'][linea]
+        touched = frame[KEY_COLUMN].isin(line_keys).to_numpy()
+        removed.append(frame[touched])
+        state['line_frames'][linea] = frame[~touched]
+    if removed:
+        removed = pd.concat(removed)
+        state['line_totals'] = _subtract(state['line_totals'], line_totals(removed))
+        state['queue_minutes'] = state['queue_minutes'].sub(_queue_minutes(removed), fill_value=0)
+        state['client_totals'] = _subtract(state['client_totals'], client_totals(removed))
+        for key in removed[KEY_COLUMN].tolist():
+            del id_line[key]
+
+    new_lines = set()
+    if len(upserts) > 0:
+        upsert_lines = upserts['Linea'].astype(str)
+        for linea, rows in upserts.groupby(upsert_lines, observed=True, sort=False):
+            frame = state['line_frames'].get(linea)
+            state['line_frames'][linea] = rows if frame is None or len(frame) == 0 else pd.concat([frame, rows])
+            new_lines.add(linea)
+        state['line_totals'] = _add(state['line_totals'], line_totals(upserts))
+        state['queue_minutes'] = state['queue_minutes'].add(_queue_minutes(upserts), fill_value=0)
+        state['client_totals'] = _add(state['client_totals'], client_totals(upserts))
+        id_line.update(zip(upserts[KEY_COLUMN].tolist(), upsert_lines.tolist()))
+
+    affected_lines = sorted(old_lines | new_lines)
+    refreshed = []
+    for linea in affected_lines:
+        if len(state['line_frames'][linea]) > 0:
+            refreshed.append(state['line_frames'][linea])
+            continue
+        for store in ('line_frames', 'line_estimates', 'client_max_days'):
+            state[store].pop(linea, None)
+    if refreshed:
+        _estimate_lines(state, refreshed)
+    state['applied_deltas'] += 1
+
+    return {
+        'inserted': int((~known & ~deletes).sum()),
+        'updated': int((known & ~deletes).sum()),
+        'deleted': int((known & deletes).sum()),
+        'missing_deletes': int((~known & deletes).sum()),
+        'affected_lines': affected_lines,
+    }
+
+
+def incremental_line_summary(state):
+    totals = state['line_totals'].sort_index()
+    # Senza interruzioni il carico di coda di una linea e' la somma dei suoi minuti non negativi
+    queue_minutes = state['queue_minutes'].reindex(totals.index, fill_value=0)
+    return line_summary_from_totals(
+        totals, queue_minutes, state['reference_time'], state['working_hours_per_day']
+    )
+
+
+def incremental_client_summary(state):
+    if not state['client_max_days']:
+        return client_summary_from_totals(state['client_totals'], pd.Series(dtype='float64'))
+    max_days = pd.concat(list(state['client_max_days'].values()))
+    max_days = max_days.groupby(level=0).max()
+    return client_summary_from_totals(state['client_totals'], max_days)
+
+
+def incremental_delivery_estimates(state, lines=None):
+    lines = sorted(state['line_estimates']) if lines is None else [
+        linea for linea in lines if linea in state['line_estimates']
+    ]
+    if not lines:
+        return build_delivery_estimates(
+            pd.DataFrame(columns=['ID_Cartellino', 'Cliente', 'Articolo', 'Linea', 'min_prd', 'ritardo_cartellino']),
+            state['working_hours_per_day'], state['reference_time']
+        )
+    estimates = pd.concat([state['line_estimates'][linea] for linea in lines], ignore_index=True)
+    return estimates.sort_values('Giorni al Completamento', ascending=False, kind='stable', ignore_index=True)
+
+
+def current_frame(state):
+    frames = [frame for frame in state['line_frames'].values() if len(frame) > 0]
+    if not frames:
+        return state['empty_frame'].drop(columns=KEY_COLUMN).reset_index(drop=True)
+    return pd.concat(frames, ignore_index=True).drop(columns=KEY_COLUMN)
@@ -0,0 +1,450 @@
+import csv
+import hashlib
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from planner.instrumentation import current_rss_mb
+from planner.parallel import process_pool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COLUMN_MAPPING = {
+    1: 'ID_Cartellino',      # B: M25_NR_CARTELLINO
+    2: 'Cliente',            # C: EW2_COD_CLIFOR
+    3: 'Articolo',           # D: Z01_CD_ART
+    6: 'Linea',              # G: Linea
+    7: 'Macro_Fase',         # H: Macro_Fase
+    8: 'M24_QT_SALDO',       # I: M24_QT_SALDO
+    26: 'min_prd',           # Colonna 26: min_prd
+    38: 'ritardo_cartellino' # Colonna 38: ritardo cartellino.1
+}
+
+MIN_REQUIRED_COLUMNS = 39
+
+NUMERIC_COLUMNS = ['min_prd', 'ritardo_cartellino', 'M24_QT_SALDO']
+
+# Stabilimento (nome del file) e origine (file e foglio) delle righe caricate insieme
+PLANT_COLUMN = 'Stabilimento'
+SOURCE_COLUMN = 'Origine'
+
+# Colonne a bassa cardinalita': un codice intero per riga invece di un oggetto stringa
+CATEGORICAL_COLUMNS = ['Cliente', 'Articolo', 'Linea', 'Macro_Fase', PLANT_COLUMN, SOURCE_COLUMN]
+
+# Cambia automaticamente quando si modifica COLUMN_MAPPING, invalidando le cache
+COLUMN_MAPPING_VERSION = hashlib.sha256(repr(sorted(COLUMN_MAPPING.items())).encode()).hexdigest()[:12]
+
+SUPPORTED_FORMATS = ['xlsx', 'csv', 'parquet']
+
+# Righe accumulate prima di convertire le colonne mappate in array pandas
+INGEST_CHUNK_ROWS = 50_000
+
+PREVIEW_ROWS = 3
+
+
+def _column_count_error(found):
+    return f"Il file deve contenere almeno {MIN_REQUIRED_COLUMNS} colonne. Trovate: {found}"
+
+
+def _coerce_numeric_columns(processed_df):
+    for col in NUMERIC_COLUMNS:
+        processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0)
+    return processed_df
+
+
+def _downcast_numeric(series):
+    values = series.to_numpy(dtype='float64')
+    if len(values) == 0:
+        return series
+    # Solo conversioni senza perdita: interi se tutti i valori sono interi, float32 se esatto
+    if np.array_equal(values, np.round(values)):
+        return pd.to_numeric(values.astype('int64'), downcast='integer')
+    as_float32 = values.astype('float32')
+    if np.array_equal(as_float32.astype('float64'), values):
+        return as_float32
+    return values
+
+
+def compact_production_frame(df):
+    compact = {}
+    for col in df.columns:
+        if col in NUMERIC_COLUMNS:
+            compact[col] = _downcast_numeric(df[col])
+        elif col == 'Linea':
+            # Linea sempre come stringa: le categorie ordinate sono l'elenco delle linee
+            compact[col] = pd.Categorical(df[col].astype(str))
+        elif col in CATEGORICAL_COLUMNS:
+            compact[col] = pd.Categorical(df[col])
+        else:
+            compact[col] = df[col].array
+    return pd.DataFrame(compact, columns=df.columns)
+
+
+def memory_report(before_df, after_df):
+    before = before_df.memory_usage(deep=True, index=False)
+    after = after_df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'Colonna': after.index,
+        'Tipo': [str(dtype) for dtype in after_df.dtypes],
+        'Memoria Originale (KB)': (before.reindex(after.index).to_numpy() / 1024).round(1),
+        'Memoria Attuale (KB)': (after.to_numpy() / 1024).round(1),
+    })
+    return report
+
+
+def merged_memory_report(source_reports, merged_df, after_df):
+    # I frame letti sono gia' compattati: la memoria originale e' la somma di quella di ogni
+    # sorgente prima della compattazione. Stabilimento e origine nascono solo nell'unione
+    report = memory_report(merged_df, after_df)
+    if source_reports:
+        original = pd.concat(source_reports).groupby('Colonna', sort=False)['Memoria Originale (KB)'].sum()
+        known = report['Colonna'].isin(original.index).to_numpy()
+        report.loc[known, 'Memoria Originale (KB)'] = original.reindex(report['Colonna'][known]).round(1).to_numpy()
+    return report
+
+
+def process_dataframe_by_position(df):
+    if len(df.columns) < MIN_REQUIRED_COLUMNS:
+        return None, _column_count_error(len(df.columns))
+
+    processed_df = pd.DataFrame(
+        {col_name: df.iloc[:, col_index].to_numpy() for col_index, col_name in COLUMN_MAPPING.items()}
+    )
+
+    return compact_production_frame(_coerce_numeric_columns(processed_df)), "OK"
+
+
+def _column_letter(i):
+    return chr(65 + i) if i < 26 else f"Col{i}"
+
+
+def build_column_preview(header, sample_rows):
+    col_info = []
+    for i, col_name in enumerate(header):
+        sample_values = [row[i] if i < len(row) else None for row in sample_rows[:PREVIEW_ROWS]]
+        col_info.append({
+            'Indice': i,
+            'Lettera Excel': _column_letter(i),
+            'Nome Colonna': str(col_name),
+            'Esempio Valori': str(sample_values)
+        })
+
+    mapping_info = []
+    for idx, internal_name in COLUMN_MAPPING.items():
+        actual_col = header[idx] if idx < len(header) else "N/A"
+        mapping_info.append({
+            'Indice': idx,
+            'Lettera': _column_letter(idx),
+            'Colonna Reale nel File': str(actual_col),
+            'Nome Interno Sistema': internal_name
+        })
+
+    return pd.DataFrame(col_info), pd.DataFrame(mapping_info)
+
+
+def _header_names(header_row):
+    # Stessa convenzione di pandas per le intestazioni vuote
+    return [f"Unnamed: {i}" if value is None else value for i, value in enumerate(header_row)]
+
+
+def _chunk_to_frame(chunk):
+    return _coerce_numeric_columns(pd.DataFrame(chunk, columns=list(COLUMN_MAPPING.values())))
+
+
+def _concat_chunks(frames):
+    if not frames:
+        return _chunk_to_frame([])
+    df = pd.concat(frames, ignore_index=True)
+    # Le colonne testuali di chunk diversi possono avere dtype diversi (es. int e object)
+    return df.infer_objects()
+
+
+def xlsx_sheet_names(file_bytes):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(BytesIO(file_bytes), read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def _read_xlsx(file_bytes, sheet=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0] if sheet is None else workbook[sheet]
+
+        preview_rows = list(worksheet.iter_rows(max_row=PREVIEW_ROWS + 1, values_only=True))
+        if not preview_rows:
+            return None, _column_count_error(0), ([], []), 0
+        header = _header_names(preview_rows[0])
+        sample_rows = preview_rows[1:]
+        if len(header) < MIN_REQUIRED_COLUMNS:
+            return None, _column_count_error(len(header)), (header, sample_rows), 0
+
+        # Solo le prime max(indice)+1 celle di ogni riga vengono materializzate
+        positions = list(COLUMN_MAPPING.keys())
+        max_col = max(positions) + 1
+        frames = []
+        chunk = []
+        # Righe con tutte le celle mappate vuote: non entrano nei dati ma vengono contate
+        skipped = 0
+        for row in worksheet.iter_rows(min_row=2, max_col=max_col, values_only=True):
+            values = [row[i] if i < len(row) else None for i in positions]
+            if all(v is None for v in values):
+                skipped += 1
+                continue
+            chunk.append(values)
+            if len(chunk) >= INGEST_CHUNK_ROWS:
+                frames.append(_chunk_to_frame(chunk))
+                chunk = []
+        if chunk:
+            frames.append(_chunk_to_frame(chunk))
+    finally:
+        workbook.close()
+
+    return _concat_chunks(frames), "OK", (header, sample_rows), skipped
+
+
+def _detect_csv_separator(file_bytes):
+    first_line = file_bytes[:64 * 1024].decode('utf-8-sig', errors='replace').splitlines()[:1]
+    try:
+        return csv.Sniffer().sniff(first_line[0], delimiters=',;\t|').delimiter
+    except (csv.Error, IndexError):
+        return ','
+
+
+def _normalise_decimal_commas(df):
+    # CSV all'italiana: "12,5" e "1.234,5". Le colonne lette come testo si riportano al punto
+    # decimale prima della conversione, che altrimenti le azzererebbe
+    for col in NUMERIC_COLUMNS:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        values = df[col].astype(str)
+        has_comma = values.str.contains(',', regex=False)
+        df[col] = values.where(
+            ~has_comma, values.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        )
+    return df
+
+
+def _read_csv(file_bytes, sheet=None):
+    sep = _detect_csv_separator(file_bytes)
+    # Con il punto e virgola (formato Excel italiano) la virgola e' il separatore decimale
+    decimal = ',' if sep == ';' else '.'
+    preview_df = pd.read_csv(BytesIO(file_bytes), sep=sep, nrows=PREVIEW_ROWS, encoding='utf-8-sig', decimal=decimal)
+    header = list(preview_df.columns)
+    sample_rows = preview_df.values.tolist()
+    if len(header) < MIN_REQUIRED_COLUMNS:
+        return None, _column_count_error(len(header)), (header, sample_rows), 0
+
+    # Nomi posizionali: le intestazioni dei gestionali possono essere duplicate
+    names = [f"c{i}" for i in range(len(header))]
+    usecols = [names[i] for i in COLUMN_MAPPING]
+    try:
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        pa_csv = None
+    if pa_csv is not None:
+        table = pa_csv.read_csv(
+            BytesIO(file_bytes),
+            read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1, encoding='utf8'),
+            parse_options=pa_csv.ParseOptions(delimiter=sep),
+            convert_options=pa_csv.ConvertOptions(include_columns=usecols),
+        )
+        df = table.to_pandas()
+    else:
+        df = pd.read_csv(
+            BytesIO(file_bytes), sep=sep, header=None, skiprows=1, names=names,
+            usecols=usecols, encoding='utf-8-sig', decimal=decimal
+        )
+    df = df[usecols]
+    df.columns = list(COLUMN_MAPPING.values())
+    if decimal == ',':
+        df = _normalise_decimal_commas(df)
+    return _coerce_numeric_columns(df), "OK", (header, sample_rows), 0
+
+
+def _read_parquet(file_bytes, sheet=None):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(BytesIO(file_bytes))
+    header = list(parquet_file.schema_arrow.names)
+    sample_rows = []
+    if parquet_file.metadata.num_rows > 0:
+        first_batch = next(parquet_file.iter_batches(batch_size=PREVIEW_ROWS))
+        sample_rows = first_batch.to_pandas().values.tolist()
+    if len(header) < MIN_REQUIRED_COLUMNS:
+        return None, _column_count_error(len(header)), (header, sample_rows), 0
+
+    # Lettura colonnare: vengono decompresse solo le colonne mappate
+    table = parquet_file.read(columns=[header[i] for i in COLUMN_MAPPING])
+    df = table.to_pandas()
+    df.columns = list(COLUMN_MAPPING.values())
+    return _coerce_numeric_columns(df), "OK", (header, sample_rows), 0
+
+
+_READERS = {
+    'xlsx': _read_xlsx,
+    'csv': _read_csv,
+    'parquet': _read_parquet,
+}
+
+
+def detect_format(file_name):
+    extension = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+    return extension if extension in _READERS else None
+
+
+def _rss_high_water_mb():
+    # Massimo storico del processo (ru_maxrss), non il picco della singola lettura:
+    # cresce solo se la lettura supera il massimo raggiunto in precedenza
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta KB, macOS byte
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def read_production_file(file_bytes, file_name, sheet=None):
+    file_format = detect_format(file_name)
+    if file_format is None:
+        col_info_df, mapping_info_df = build_column_preview([], [])
+        message = f"Formato non supportato: {file_name}. Formati ammessi: {', '.join(SUPPORTED_FORMATS)}"
+        return None, message, col_info_df, mapping_info_df, None
+
+    high_water_before = _rss_high_water_mb()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    df, message, (header, sample_rows), skipped_rows = _READERS[file_format](file_bytes, sheet)
+    projected_df = df
+    if df is not None:
+        df = compact_production_frame(df)
+    elapsed = time.perf_counter() - start
+    high_water = _rss_high_water_mb()
+    rss_after = current_rss_mb()
+
+    report = None if df is None else memory_report(projected_df, df)
+
+    col_info_df, mapping_info_df = build_column_preview(header, sample_rows)
+    ingest_stats = {
+        'format': file_format,
+        'seconds': elapsed,
+        'rows': 0 if df is None else len(df),
+        'skipped_rows': skipped_rows,
+        'rss_high_water_mb': high_water,
+        'rss_high_water_growth_mb': None if high_water is None else high_water - high_water_before,
+        # RSS attuale dopo meno prima: memoria trattenuta dalla lettura, non il suo picco
+        'rss_retained_mb': None if rss_before is None or rss_after is None else rss_after - rss_before,
+        'memory_report': report,
+    }
+    return df, message, col_info_df, mapping_info_df, ingest_stats
+
+
+def _source_tasks(sources):
+    tasks = []
+    for file_name, file_bytes in sources:
+        plant = os.path.splitext(os.path.basename(file_name))[0]
+        sheets = [None]
+        if detect_format(file_name) == 'xlsx':
+            try:
+                sheets = xlsx_sheet_names(file_bytes)
+            except Exception:
+                sheets = [None]
+        for sheet in sheets:
+            label = plant if sheet is None or len(sheets) == 1 else f"{plant} / {sheet}"
+            tasks.append((file_name, file_bytes, sheet, plant, label))
+    return tasks
+
+
+def _read_source(file_bytes, file_name, sheet):
+    # Un foglio illeggibile non deve far fallire gli altri file del caricamento
+    try:
+        return read_production_file(file_bytes, file_name, sheet)
+    except Exception as e:
+        col_info_df, mapping_info_df = build_column_preview([], [])
+        return None, f"File non leggibile: {e}", col_info_df, mapping_info_df, None
+
+
+def read_production_sources(sources, max_workers=None):
+    # sources: lista di (nome file, byte). Ogni foglio di ogni file e' letto in un processo separato
+    tasks = _source_tasks(sources)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    workers = max(1, min(max_workers, len(tasks)))
+
+    high_water_before = _rss_high_water_mb()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    names = [task[0] for task in tasks]
+    payloads = [task[1] for task in tasks]
+    sheets = [task[2] for task in tasks]
+    if workers == 1:
+        results = [_read_source(*args) for args in zip(payloads, names, sheets)]
+    else:
+        with process_pool(workers) as pool:
+            results = list(pool.map(_read_source, payloads, names, sheets))
+
+    frames = []
+    source_reports = []
+    source_rows = []
+    preview = None
+    errors = []
+    for (_, _, _, plant, label), (df, message, col_info_df, mapping_info_df, stats) in zip(tasks, results):
+        source_rows.append({
+            SOURCE_COLUMN: label,
+            PLANT_COLUMN: plant,
+            'Righe': 0 if df is None else len(df),
+            'Righe Vuote Scartate': 0 if stats is None else stats['skipped_rows'],
+            'Secondi': None if stats is None else round(stats['seconds'], 3),
+            'Esito': message,
+        })
+        if df is None:
+            errors.append(f"{label}: {message}")
+            continue
+        if preview is None:
+            preview = (col_info_df, mapping_info_df)
+        frames.append(df.assign(**{PLANT_COLUMN: plant, SOURCE_COLUMN: label}))
+        if stats is not None and stats['memory_report'] is not None:
+            source_reports.append(stats['memory_report'])
+
+    if preview is None:
+        col_info_df, mapping_info_df = build_column_preview([], [])
+    else:
+        col_info_df, mapping_info_df = preview
+    if not frames:
+        return None, "; ".join(errors), col_info_df, mapping_info_df, None
+
+    merged = pd.concat(frames, ignore_index=True)
+    if merged[PLANT_COLUMN].nunique() > 1:
+        # Linee omonime di stabilimenti diversi sono code distinte
+        merged['Linea'] = merged[PLANT_COLUMN].astype(str) + ' / ' + merged['Linea'].astype(str)
+    df = compact_production_frame(merged)
+    elapsed = time.perf_counter() - start
+
+    high_water = _rss_high_water_mb()
+    rss_after = current_rss_mb()
+    source_df = pd.DataFrame(source_rows)
+    ingest_stats = {
+        'format': '+'.join(sorted({detect_format(name) or '?' for name in names})),
+        'seconds': elapsed,
+        'rows': len(df),
+        'skipped_rows': int(source_df['Righe Vuote Scartate'].sum()),
+        # Solo il processo principale: la memoria dei processi di lettura non e' inclusa
+        'rss_high_water_mb': high_water,
+        'rss_high_water_growth_mb': None if high_water is None else high_water - high_water_before,
+        'rss_retained_mb': None if rss_before is None or rss_after is None else rss_after - rss_before,
+        'memory_report': merged_memory_report(source_reports, merged, df),
+        'sources': source_df,
+        'workers': workers,
+    }
+    return df, "OK", col_info_df, mapping_info_df, ingest_stats
@@ -0,0 +1,118 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Pannello "Prestazioni" e log attivi solo con PLANNER_PERF=1
+PERF_ENV = 'PLANNER_PERF'
+PERF_LOG_ENV = 'PLANNER_PERF_LOG'
+PERF_PROFILE_DIR_ENV = 'PLANNER_PERF_PROFILE_DIR'
+
+DEFAULT_PERF_LOG = 'prestazioni.jsonl'
+DEFAULT_PROFILE_DIR = 'profili'
+
+PROFILE_TOP_FUNCTIONS = 25
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def perf_enabled():
+    return os.environ.get(PERF_ENV, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def perf_log_path():
+    return os.environ.get(PERF_LOG_ENV) or DEFAULT_PERF_LOG
+
+
+def profile_dir():
+    return os.environ.get(PERF_PROFILE_DIR_ENV) or DEFAULT_PROFILE_DIR
+
+
+def current_rss_mb():
+    # RSS attuale (non il picco): la differenza tra due letture e' la memoria trattenuta dallo stadio
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RerunRecorder:
+    # Tempi, righe e memoria dei singoli stadi di un'esecuzione dello script
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.stages = []
+        self.started = time.perf_counter()
+        self.started_at = datetime.now()
+        self.profiler = None
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {'stage': name, 'rows': rows}
+        if not self.enabled:
+            yield record
+            return
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            rss_after = current_rss_mb()
+            record['seconds'] = time.perf_counter() - start
+            record['memory_delta_mb'] = None if rss_before is None or rss_after is None else rss_after - rss_before
+            self.stages.append(record)
+
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def start_profile(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self, output_dir):
+        if self.profiler is None:
+            return None, None
+        self.profiler.disable()
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"rerun_{self.started_at.strftime('%Y%m%d_%H%M%S_%f')}.prof")
+        self.profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(self.profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        self.profiler = None
+        return path, summary.getvalue()
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'Stadio': [record['stage'] for record in self.stages],
+            'Secondi': [round(record['seconds'], 4) for record in self.stages],
+            'Righe': pd.array([record['rows'] for record in self.stages], dtype='Int64'),
+            'Delta Memoria (MB)': [
+                None if record['memory_delta_mb'] is None else round(record['memory_delta_mb'], 1)
+                for record in self.stages
+            ],
+        })
+
+    def log_entry(self, **extra):
+        entry = {
+            'timestamp': self.started_at.isoformat(timespec='milliseconds'),
+            'total_seconds': round(self.total_seconds(), 6),
+            'rss_mb': current_rss_mb(),
+            'stages': [
+                {key: (round(value, 6) if isinstance(value, float) else value) for key, value in record.items()}
+                for record in self.stages
+            ],
+        }
+        entry.update(extra)
+        return entry
+
+
+def append_log(entry, path=None):
+    with open(path or perf_log_path(), 'a', encoding='utf-8') as handle:
+        handle.write(json.dumps(entry, default=str) + '\n')
@@ -0,0 +1,15 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Nell'app i pool partono da un thread di Streamlit: un fork copierebbe nel figlio lock tenuti in
+# quel momento da altri thread. Il forkserver crea i processi da un server pulito, avviato una volta
+# sola con i moduli di calcolo gia' importati; dove non esiste (Windows) si usa spawn
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+POOL_PRELOAD = ['planner.ingestion', 'planner.sequencing']
+
+
+def process_pool(workers):
+    context = multiprocessing.get_context(POOL_START_METHOD)
+    if POOL_START_METHOD == 'forkserver':
+        context.set_forkserver_preload(POOL_PRELOAD)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
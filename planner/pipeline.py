@@ -0,0 +1,53 @@
+import time
+from datetime import datetime
+
+from planner.estimates import build_delivery_estimates
+from planner.scheduling import DEFAULT_WORKING_HOURS, build_line_schedule, line_loads
+from planner.sequencing import optimize_sequence
+from planner.summaries import build_line_summary
+from planner.work_orders import build_work_orders
+
+# Nome del foglio e suffisso del file per ciascun report generato
+REPORTS = [
+    ('Ordini_Lavoro', 'ordini_lavoro'),
+    ('Dashboard', 'dashboard'),
+    ('Stime_Consegna', 'stime_consegna'),
+]
+
+
+def build_reports(df, working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None, timings=None,
+                  sequence_budget=None):
+    if reference_time is None:
+        reference_time = datetime.now()
+    if timings is None:
+        timings = {}
+
+    order = None
+    if sequence_budget is not None:
+        start = time.perf_counter()
+        # Un solo processo: la riga di comando elabora gia' i file in parallelo
+        order = optimize_sequence(df, sequence_budget, working_hours_per_day, max_workers=1)['order']
+        timings['sequence'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    schedule = build_line_schedule(df, order)
+    queue_minutes = line_loads(schedule)
+    timings['schedule'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    work_orders_df, _ = build_work_orders(df, order)
+    timings['work_orders'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linea_summary = build_line_summary(df, queue_minutes, reference_time, working_hours_per_day)
+    timings['dashboard'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    delivery_df = build_delivery_estimates(df, working_hours_per_day, reference_time, schedule=schedule)
+    timings['delivery'] = time.perf_counter() - start
+
+    return {
+        'Ordini_Lavoro': work_orders_df,
+        'Dashboard': linea_summary,
+        'Stime_Consegna': delivery_df,
+    }
@@ -0,0 +1,36 @@
+import numpy as np
+
+PRIORITY_LABELS = ["🔴 Critico", "🟠 Alto", "🟡 Medio", "🟢 Normale"]
+PRIORITY_COLORS = ["#dc3545", "#fd7e14", "#ffc107", "#28a745"]
+
+
+def get_priority_status(delay):
+    if delay > 10:
+        return "🔴 Critico"
+    elif delay > 5:
+        return "🟠 Alto"
+    elif delay > 0:
+        return "🟡 Medio"
+    else:
+        return "🟢 Normale"
+
+
+def get_priority_color(delay):
+    if delay > 10:
+        return "#dc3545"
+    elif delay > 5:
+        return "#fd7e14"
+    elif delay > 0:
+        return "#ffc107"
+    else:
+        return "#28a745"
+
+
+def get_priority_levels(delays):
+    # Indice in PRIORITY_LABELS/PRIORITY_COLORS, stesse soglie di get_priority_status
+    delays = np.asarray(delays, dtype='float64')
+    return np.select([delays > 10, delays > 5, delays > 0], [0, 1, 2], default=3)
+
+
+def get_priority_statuses(delays):
+    return np.asarray(PRIORITY_LABELS, dtype=object)[get_priority_levels(delays)]
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_WORKING_HOURS = 8
+
+
+def line_categories(df):
+    # Il frame normalizzato ha gia' Linea come categorie stringa ordinate
+    if isinstance(df['Linea'].dtype, pd.CategoricalDtype):
+        return df['Linea'].array
+    return pd.Categorical(df['Linea'].astype(str))
+
+
+def priority_order(df):
+    # Stessa sequenza di tab 1: linee in ordine alfabetico, poi ritardo decrescente (stabile)
+    linee = line_categories(df)
+    order = np.lexsort((-df['ritardo_cartellino'].to_numpy(dtype='float64'), linee.codes))
+    return linee, order
+
+
+def build_line_schedule(df, order=None):
+    # order: permutazione delle righe con le linee contigue, di default quella di priority_order
+    if order is None:
+        linee, order = priority_order(df)
+    else:
+        linee = line_categories(df)
+    codes = linee.codes[order]
+    minutes = np.clip(df['min_prd'].to_numpy(dtype='float64')[order], 0, None)
+
+    # Ogni linea lavora un ordine alla volta: la fine di un ordine e' la somma cumulata
+    # dei minuti che lo precedono in coda sulla stessa linea
+    counts = np.bincount(codes, minlength=len(linee.categories))
+    starts = np.cumsum(counts) - counts
+    cumulative = np.cumsum(minutes)
+    line_offset = np.concatenate([[0.0], cumulative])[starts]
+    finish = cumulative - line_offset[codes]
+
+    return pd.DataFrame({
+        'row': order,
+        'Linea': linee.categories.take(codes),
+        'queue_position': np.arange(len(order)) - starts[codes] + 1,
+        'start_min': finish - minutes,
+        'finish_min': finish,
+    })
+
+
+def minutes_to_days(minutes, working_hours_per_day=DEFAULT_WORKING_HOURS):
+    # La capacita' di una linea e' working_hours_per_day ore di produzione per giorno di calendario
+    return minutes / (working_hours_per_day * 60)
+
+
+def schedule_by_row(schedule, column):
+    # Riporta una colonna della coda all'ordine delle righe del frame normalizzato
+    values = np.empty(len(schedule), dtype=schedule[column].dtype)
+    values[schedule['row'].to_numpy()] = schedule[column].to_numpy()
+    return values
+
+
+def line_loads(schedule):
+    # Minuti in coda per linea = fine dell'ultimo ordine della linea
+    return schedule.groupby('Linea', sort=True)['finish_min'].max()
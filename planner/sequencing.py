@@ -0,0 +1,230 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from planner.parallel import process_pool
+from planner.scheduling import DEFAULT_WORKING_HOURS, priority_order
+
+# Secondi complessivi concessi alla ricerca locale, per tutte le linee
+DEFAULT_TIME_BUDGET = 5.0
+
+# Sotto questa variazione (minuti-giorno pesati) una mossa non e' considerata un miglioramento
+IMPROVEMENT_EPS = 1e-9
+
+RULE_LABELS = {'edd': "Ritardo decrescente", 'wspt': "Minuti brevi prima"}
+
+
+def _tardiness(completion, due, weights):
+    return weights * np.maximum(completion - due, 0.0)
+
+
+def sequence_tardiness(minutes, due, weights, sequence):
+    # Ritardo pesato totale di una sequenza: una cumsum, nessun ciclo sugli ordini
+    completion = np.cumsum(minutes[sequence])
+    return float(_tardiness(completion, due[sequence], weights[sequence]).sum())
+
+
+def _swap_pass(minutes, due, weights, sequence):
+    # Scambi di ordini adiacenti: ognuno cambia solo la fine dei due ordini coinvolti,
+    # quindi tutti i delta si valutano insieme e gli scambi disgiunti si applicano insieme
+    if len(sequence) < 2:
+        return 0.0
+    p, d, w = minutes[sequence], due[sequence], weights[sequence]
+    completion = np.cumsum(p)
+    first, second = slice(0, -1), slice(1, None)
+    before = _tardiness(completion[first], d[first], w[first]) + _tardiness(completion[second], d[second], w[second])
+    start = completion[first] - p[first]
+    after = (_tardiness(start + p[second], d[second], w[second])
+             + _tardiness(completion[second], d[first], w[first]))
+    delta = after - before
+
+    # Minimi locali dei delta: due coppie scelte non condividono mai un ordine
+    padded = np.concatenate([[np.inf], delta, [np.inf]])
+    chosen = np.flatnonzero((delta < -IMPROVEMENT_EPS) & (delta < padded[:-2]) & (delta <= padded[2:]))
+    if len(chosen) == 0:
+        return 0.0
+    sequence[chosen], sequence[chosen + 1] = sequence[chosen + 1], sequence[chosen].copy()
+    return float(delta[chosen].sum())
+
+
+def _best_insertion(minutes, due, weights, sequence, position):
+    # Miglior nuova posizione per l'ordine in `position`: gli ordini scavalcati slittano
+    # tutti della sua durata, il delta di ogni destinazione viene da una somma cumulata
+    p, d, w = minutes[sequence], due[sequence], weights[sequence]
+    completion = np.cumsum(p)
+    job_p, job_d, job_w = p[position], d[position], w[position]
+    current = _tardiness(completion[position], job_d, job_w)
+
+    earlier = slice(0, position)
+    shifted = _tardiness(completion[earlier] + job_p, d[earlier], w[earlier]) - _tardiness(
+        completion[earlier], d[earlier], w[earlier])
+    moved = _tardiness(completion[earlier] - p[earlier] + job_p, job_d, job_w)
+    earlier_delta = moved - current + np.cumsum(shifted[::-1])[::-1]
+
+    later = slice(position + 1, None)
+    shifted = _tardiness(completion[later] - job_p, d[later], w[later]) - _tardiness(
+        completion[later], d[later], w[later])
+    moved = _tardiness(completion[later], job_d, job_w)
+    later_delta = moved - current + np.cumsum(shifted)
+
+    delta = np.concatenate([earlier_delta, [0.0], later_delta])
+    target = int(np.argmin(delta))
+    return target, float(delta[target])
+
+
+def improve_sequence(minutes, due, weights, sequence, deadline):
+    sequence = sequence.copy()
+    moves = 0
+    while time.perf_counter() < deadline:
+        if _swap_pass(minutes, due, weights, sequence) < 0:
+            moves += 1
+            continue
+        # Nessuno scambio adiacente migliora: si provano gli spostamenti, prima gli ordini
+        # che contribuiscono di piu' al ritardo
+        completion = np.cumsum(minutes[sequence])
+        contribution = _tardiness(completion, due[sequence], weights[sequence])
+        improved = False
+        for position in np.argsort(-contribution, kind='stable'):
+            if time.perf_counter() >= deadline:
+                break
+            target, delta = _best_insertion(minutes, due, weights, sequence, position)
+            if delta < -IMPROVEMENT_EPS:
+                job = sequence[position]
+                sequence = np.insert(np.delete(sequence, position), target, job)
+                moves += 1
+                improved = True
+                break
+        if not improved:
+            break
+    return sequence, moves
+
+
+def _initial_sequences(minutes, due, weights):
+    n = len(minutes)
+    # Le posizioni in ingresso seguono gia' l'ordine attuale (ritardo decrescente)
+    ratio = np.divide(minutes, weights, out=np.full(n, np.inf), where=weights > 0)
+    return {
+        'edd': np.arange(n),
+        'wspt': np.lexsort((due, ratio)),
+    }
+
+
+def optimize_line(minutes, due, weights, deadline):
+    current = sequence_tardiness(minutes, due, weights, np.arange(len(minutes)))
+    candidates = _initial_sequences(minutes, due, weights)
+    scores = {rule: sequence_tardiness(minutes, due, weights, seq) for rule, seq in candidates.items()}
+    rule = min(scores, key=scores.get)
+    sequence, moves = candidates[rule], 0
+    if scores[rule] > 0:
+        sequence, moves = improve_sequence(minutes, due, weights, sequence, deadline)
+    optimized = sequence_tardiness(minutes, due, weights, sequence)
+    if optimized > current:
+        # Mai peggio della sequenza attuale
+        sequence, optimized, rule = np.arange(len(minutes)), current, 'edd'
+    return {
+        'sequence': sequence,
+        'current': current,
+        'optimized': optimized,
+        'rule': rule,
+        'moves': moves,
+    }
+
+
+def _optimize_lines(tasks, deadline):
+    # deadline e' un istante assoluto (time.time) fissato dal chiamante e uguale per tutti i processi:
+    # l'avvio dei processi consuma il budget invece di allungarlo. Il tempo rimasto si ridivide tra
+    # le linee ancora da elaborare: una linea gia' ottima lascia il suo tempo alle successive
+    results = []
+    for index, (linea, minutes, due, weights) in enumerate(tasks):
+        remaining = max(deadline - time.time(), 0)
+        line_deadline = time.perf_counter() + remaining / (len(tasks) - index)
+        result = optimize_line(minutes, due, weights, line_deadline)
+        result['linea'] = linea
+        results.append(result)
+    return results
+
+
+def _split_tasks(tasks, workers):
+    # Linee piu' lunghe per prime, distribuite a turno tra i processi
+    chunks = [[] for _ in range(workers)]
+    for index, task in enumerate(sorted(tasks, key=lambda task: len(task[1]), reverse=True)):
+        chunks[index % workers].append(task)
+    return [chunk for chunk in chunks if chunk]
+
+
+def optimize_sequence(df, time_budget=DEFAULT_TIME_BUDGET, working_hours_per_day=DEFAULT_WORKING_HOURS,
+                      weights=None, max_workers=None):
+    started = time.perf_counter()
+    deadline = time.time() + time_budget
+    linee, order = priority_order(df)
+    codes = linee.codes[order]
+    minutes_per_day = working_hours_per_day * 60
+    minutes = np.clip(df['min_prd'].to_numpy(dtype='float64')[order], 0, None)
+    # Scadenza in minuti di linea da adesso: un ordine in ritardo di r giorni scadeva r giorni fa
+    due = -df['ritardo_cartellino'].to_numpy(dtype='float64')[order] * minutes_per_day
+    if weights is None:
+        weights = np.ones(len(order))
+    else:
+        weights = np.asarray(weights, dtype='float64')[order]
+
+    counts = np.bincount(codes, minlength=len(linee.categories))
+    stops = np.cumsum(counts)
+    starts = stops - counts
+    tasks = [
+        (str(linea), minutes[start:stop], due[start:stop], weights[start:stop])
+        for linea, start, stop in zip(linee.categories, starts, stops)
+        if stop > start
+    ]
+    line_starts = {str(linea): start for linea, start in zip(linee.categories, starts)}
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    workers = max(1, min(max_workers, len(tasks)))
+    chunks = _split_tasks(tasks, workers)
+    if len(chunks) <= 1:
+        results = [result for chunk in chunks for result in _optimize_lines(chunk, deadline)]
+    else:
+        with process_pool(len(chunks)) as pool:
+            results = [
+                result
+                for chunk_results in pool.map(_optimize_lines, chunks, [deadline] * len(chunks))
+                for result in chunk_results
+            ]
+
+    optimized_order = order.copy()
+    records = []
+    for result in sorted(results, key=lambda result: line_starts[result['linea']]):
+        start = line_starts[result['linea']]
+        sequence = result['sequence']
+        optimized_order[start:start + len(sequence)] = order[start + sequence]
+        records.append({
+            'Linea': result['linea'],
+            'N. Ordini': len(sequence),
+            'Regola Iniziale': RULE_LABELS[result['rule']],
+            'Ritardo Attuale (gg)': result['current'] / minutes_per_day,
+            'Ritardo Ottimizzato (gg)': result['optimized'] / minutes_per_day,
+            'Mosse': result['moves'],
+        })
+
+    lines = pd.DataFrame(records, columns=[
+        'Linea', 'N. Ordini', 'Regola Iniziale', 'Ritardo Attuale (gg)', 'Ritardo Ottimizzato (gg)', 'Mosse'
+    ])
+    current_days = lines['Ritardo Attuale (gg)'].to_numpy(dtype='float64')
+    optimized_days = lines['Ritardo Ottimizzato (gg)'].to_numpy(dtype='float64')
+    lines['Miglioramento %'] = (100 * np.divide(
+        current_days - optimized_days, current_days, out=np.zeros(len(lines)), where=current_days > 0
+    )).round(1)
+    lines[['Ritardo Attuale (gg)', 'Ritardo Ottimizzato (gg)']] = lines[
+        ['Ritardo Attuale (gg)', 'Ritardo Ottimizzato (gg)']
+    ].round(1)
+
+    return {
+        'order': optimized_order,
+        'lines': lines,
+        'current_tardiness': float(current_days.sum()),
+        'optimized_tardiness': float(optimized_days.sum()),
+        'seconds': time.perf_counter() - started,
+        'workers': len(chunks),
+    }
@@ -0,0 +1,220 @@
+import json
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from planner.ingestion import COLUMN_MAPPING_VERSION, PLANT_COLUMN
+
+SNAPSHOT_DIR_ENV = 'PLANNER_SNAPSHOT_DIR'
+DEFAULT_SNAPSHOT_DIR = 'snapshots'
+
+# Conservazione: per ogni origine resta l'ultimo caricamento di ogni giorno, per al massimo
+# questo numero di giorni (0 = nessun limite)
+SNAPSHOT_KEEP_ENV = 'PLANNER_SNAPSHOT_KEEP_DAYS'
+DEFAULT_SNAPSHOT_KEEP_DAYS = 30
+
+# Arrow IPC senza compressione: il file si mappa in memoria e le colonne non vengono copiate
+SNAPSHOT_EXTENSION = '.arrow'
+SNAPSHOT_METADATA_KEY = b'planner_snapshot'
+SNAPSHOT_HASH_CHARS = 16
+
+# Campi confrontati per gli ordini presenti in entrambi gli snapshot. Il ritardo e' escluso:
+# cresce di un giorno ogni giorno per tutti gli ordini aperti
+DIFF_COLUMNS = ['Cliente', 'Articolo', 'Linea', 'Macro_Fase', 'M24_QT_SALDO', 'min_prd']
+
+
+def snapshot_dir():
+    return os.environ.get(SNAPSHOT_DIR_ENV) or DEFAULT_SNAPSHOT_DIR
+
+
+def snapshot_keep_days():
+    value = os.environ.get(SNAPSHOT_KEEP_ENV, '').strip()
+    return int(value) if value else DEFAULT_SNAPSHOT_KEEP_DAYS
+
+
+def snapshot_path(content_hash, snapshot_date, store_dir=None):
+    name = f"{snapshot_date.isoformat()}_{content_hash[:SNAPSHOT_HASH_CHARS]}{SNAPSHOT_EXTENSION}"
+    return os.path.join(store_dir or snapshot_dir(), name)
+
+
+def save_snapshot(df, content_hash, file_name, snapshot_date=None, store_dir=None):
+    import pyarrow as pa
+
+    if snapshot_date is None:
+        snapshot_date = date.today()
+    path = snapshot_path(content_hash, snapshot_date, store_dir)
+    if os.path.exists(path):
+        return path
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {
+        'content_hash': content_hash,
+        'file_name': file_name,
+        'source': snapshot_source(df, file_name),
+        'snapshot_date': snapshot_date.isoformat(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': len(df),
+        'mapping_version': COLUMN_MAPPING_VERSION,
+    }
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        SNAPSHOT_METADATA_KEY: json.dumps(metadata).encode(),
+    })
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Scrittura su file temporaneo e rename: un processo concorrente non legge mai un file a meta'
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, path)
+    return path
+
+
+def _read_metadata(path):
+    import pyarrow as pa
+
+    with pa.memory_map(path, 'r') as source:
+        schema = pa.ipc.open_file(source).schema
+    raw = (schema.metadata or {}).get(SNAPSHOT_METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def store_version(store_dir=None):
+    # Cambia a ogni file aggiunto, sostituito o rimosso nella cartella: basta come chiave di cache
+    # dell'elenco, senza aprire i file
+    try:
+        return os.stat(store_dir or snapshot_dir()).st_mtime_ns
+    except OSError:
+        return None
+
+
+def list_snapshots(store_dir=None):
+    store_dir = store_dir or snapshot_dir()
+    records = []
+    if os.path.isdir(store_dir):
+        for name in os.listdir(store_dir):
+            if not name.endswith(SNAPSHOT_EXTENSION):
+                continue
+            path = os.path.join(store_dir, name)
+            try:
+                metadata = _read_metadata(path)
+            except (OSError, ValueError):
+                continue
+            if not metadata:
+                continue
+            records.append({
+                'Data': metadata['snapshot_date'],
+                'File': metadata['file_name'],
+                # Gli snapshot salvati prima dell'origine nei metadati restano distinti per nome file
+                'Origine': metadata.get('source', metadata['file_name']),
+                'Righe': metadata['rows'],
+                'Hash': metadata['content_hash'],
+                'Salvato': metadata['created_at'],
+                'Percorso': path,
+            })
+    columns = ['Data', 'File', 'Origine', 'Righe', 'Hash', 'Salvato', 'Percorso']
+    snapshots = pd.DataFrame(records, columns=columns)
+    return snapshots.sort_values(['Data', 'Salvato'], ascending=False, ignore_index=True)
+
+
+def prune_snapshots(keep_days=None, store_dir=None):
+    # Da chiamare dopo ogni salvataggio: per ogni origine restano l'ultimo caricamento di ogni
+    # giorno e solo i keep_days giorni piu' recenti. Restituisce i percorsi rimossi
+    if keep_days is None:
+        keep_days = snapshot_keep_days()
+    snapshots = list_snapshots(store_dir)
+    if keep_days <= 0 or len(snapshots) == 0:
+        return []
+    # L'elenco e' gia' ordinato dal piu' recente
+    latest_of_day = ~snapshots.duplicated(['Origine', 'Data'])
+    day_rank = snapshots[latest_of_day].groupby('Origine').cumcount()
+    keep = latest_of_day & day_rank.reindex(snapshots.index).lt(keep_days)
+    removed = []
+    for path in snapshots.loc[~keep, 'Percorso']:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+    return removed
+
+
+def snapshot_source(df, file_name):
+    # Origine di uno snapshot per i confronti nel tempo: gli stabilimenti che contiene (restano
+    # anche dopo i delta, che non cambiano nome al file), altrimenti il nome del caricamento
+    if PLANT_COLUMN in df.columns:
+        plants = sorted(df[PLANT_COLUMN].dropna().astype(str).unique())
+        if plants:
+            return ' + '.join(plants)
+    return file_name
+
+
+def load_snapshot(path):
+    import pyarrow as pa
+
+    # Le colonne numeriche restano viste sulla mappa del file, senza copia in memoria
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+def _line_totals(df):
+    return df.groupby(df['Linea'].astype(str), observed=True).agg(
+        Ordini=('ID_Cartellino', 'count'),
+        Minuti=('min_prd', 'sum'),
+    )
+
+
+def _keyed(df, id_as_str):
+    keyed = df[['ID_Cartellino'] + DIFF_COLUMNS].copy()
+    if id_as_str:
+        keyed['ID_Cartellino'] = keyed['ID_Cartellino'].astype(str)
+    for col in ['Cliente', 'Articolo', 'Linea', 'Macro_Fase']:
+        # Categorie diverse tra i due snapshot: confronto sui valori testuali
+        keyed[col] = keyed[col].astype(str)
+    return keyed.drop_duplicates('ID_Cartellino', keep='last')
+
+
+def diff_snapshots(old_df, new_df):
+    # ID confrontati come testo solo se i due file li hanno letti con tipi diversi
+    id_as_str = old_df['ID_Cartellino'].dtype != new_df['ID_Cartellino'].dtype
+    old = _keyed(old_df, id_as_str)
+    new = _keyed(new_df, id_as_str)
+
+    # Hash join sull'ID: una sola merge esterna classifica tutte le righe
+    merged = old.merge(new, on='ID_Cartellino', how='outer', suffixes=(' Prima', ' Dopo'), indicator=True)
+    status = merged['_merge']
+
+    new_orders = merged.loc[status == 'right_only', ['ID_Cartellino'] + [f"{col} Dopo" for col in DIFF_COLUMNS]]
+    new_orders.columns = ['ID_Cartellino'] + DIFF_COLUMNS
+    closed_orders = merged.loc[status == 'left_only', ['ID_Cartellino'] + [f"{col} Prima" for col in DIFF_COLUMNS]]
+    closed_orders.columns = ['ID_Cartellino'] + DIFF_COLUMNS
+
+    both = merged[status == 'both']
+    changed_mask = np.zeros(len(both), dtype=bool)
+    changed_fields = np.full(len(both), '', dtype=object)
+    for col in DIFF_COLUMNS:
+        differs = (both[f"{col} Prima"] != both[f"{col} Dopo"]).to_numpy()
+        changed_mask |= differs
+        changed_fields = np.where(differs, changed_fields + col + ' ', changed_fields)
+    changed_orders = both.loc[changed_mask, ['ID_Cartellino'] + [
+        f"{col} {side}" for col in DIFF_COLUMNS for side in ('Prima', 'Dopo')
+    ]].copy()
+    changed_orders.insert(1, 'Campi Modificati', [fields.strip() for fields in changed_fields[changed_mask]])
+
+    line_delta = _line_totals(old_df).join(_line_totals(new_df), how='outer', lsuffix=' Prima', rsuffix=' Dopo')
+    line_delta = line_delta.fillna(0)
+    line_delta['Delta Ordini'] = line_delta['Ordini Dopo'] - line_delta['Ordini Prima']
+    line_delta['Delta Minuti'] = line_delta['Minuti Dopo'] - line_delta['Minuti Prima']
+    line_delta['Delta Ore'] = (line_delta['Delta Minuti'] / 60).round(1)
+    line_delta = line_delta.rename_axis('Linea').reset_index()
+    line_delta = line_delta.sort_values('Delta Minuti', key=np.abs, ascending=False, ignore_index=True)
+
+    return {
+        'new': new_orders.reset_index(drop=True),
+        'closed': closed_orders.reset_index(drop=True),
+        'changed': changed_orders.reset_index(drop=True),
+        'line_delta': line_delta,
+    }
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from planner.scheduling import DEFAULT_WORKING_HOURS, minutes_to_days
+
+CRITICAL_DELAY_DAYS = 10
+HIGH_DELAY_DAYS = 5
+
+# Una linea e' un collo di bottiglia se supera di questo fattore il carico medio
+BOTTLENECK_FACTOR = 1.5
+
+LINE_SUMMARY_DISPLAY_COLUMNS = [
+    'Linea', 'N. Ordini', 'Ore Totali', 'Giorni Coda', 'Fine Coda Stimata', 'Ritardo Medio', 'Quantità Saldo'
+]
+
+
+def plant_metrics(df):
+    return {
+        'total_orders': len(df),
+        'total_hours': df['min_prd'].sum() / 60,
+        'avg_delay': df['ritardo_cartellino'].mean(),
+        'critical_orders': int((df['ritardo_cartellino'] > CRITICAL_DELAY_DAYS).sum()),
+    }
+
+
+def _plant_values(df, plant_column):
+    # Raggruppamento sui codici interi della colonna categoriale, senza una copia in testo per riga
+    plants = df[plant_column]
+    return plants if isinstance(plants.dtype, pd.CategoricalDtype) else plants.astype('category')
+
+
+def plant_names(df, plant_column='Stabilimento'):
+    categories = _plant_values(df, plant_column).cat.remove_unused_categories().cat.categories
+    return sorted(str(plant) for plant in categories)
+
+
+def build_plant_summary(df, plant_column='Stabilimento'):
+    plants = _plant_values(df, plant_column)
+    plant_summary = df.groupby(plants, observed=True).agg(**{
+        'N. Ordini': ('min_prd', 'size'),
+        'Linee': ('Linea', 'nunique'),
+        'Minuti Totali': ('min_prd', 'sum'),
+        'Ritardo Medio': ('ritardo_cartellino', 'mean'),
+    })
+    plant_summary['Ordini Critici'] = (df['ritardo_cartellino'] > CRITICAL_DELAY_DAYS).groupby(plants, observed=True).sum()
+    plant_summary = _str_index(plant_summary).rename_axis('Stabilimento').reset_index()
+    plant_summary['Ore Totali'] = (plant_summary['Minuti Totali'] / 60).round(1)
+    plant_summary['Ritardo Medio'] = plant_summary['Ritardo Medio'].round(1)
+    return plant_summary[['Stabilimento', 'N. Ordini', 'Linee', 'Ore Totali', 'Ritardo Medio', 'Ordini Critici']]
+
+
+def _whole_numbers(values):
+    # Le somme aggiornate per differenza restano float: interi se non c'e' parte decimale
+    values = np.asarray(values, dtype='float64')
+    return values.astype('int64') if np.array_equal(values, np.round(values)) else values
+
+
+def _str_index(frame):
+    # Raggruppamento sulla colonna categoriale; solo l'indice del risultato diventa testo
+    frame.index = frame.index.astype(str)
+    return frame
+
+
+def line_totals(df):
+    # Somme additive per linea: la media del ritardo si ricava da somma e conteggio
+    totals = df.groupby('Linea', observed=True).agg(**{
+        'N. Ordini': ('min_prd', 'size'),
+        'Minuti Totali': ('min_prd', 'sum'),
+        'Somma Ritardo': ('ritardo_cartellino', 'sum'),
+        'Quantità Saldo': ('M24_QT_SALDO', 'sum'),
+    })
+    return _str_index(totals).rename_axis('Linea').astype('float64')
+
+
+def line_summary_from_totals(totals, queue_minutes, reference_time=None,
+                             working_hours_per_day=DEFAULT_WORKING_HOURS):
+    linea_summary = pd.DataFrame({
+        'Linea': totals.index.to_numpy(),
+        'N. Ordini': totals['N. Ordini'].to_numpy().astype('int64'),
+        'Minuti Totali': _whole_numbers(totals['Minuti Totali']),
+        'Ritardo Medio': (totals['Somma Ritardo'] / totals['N. Ordini']).round(1).to_numpy(),
+        'Quantità Saldo': totals['Quantità Saldo'].to_numpy(),
+    })
+    linea_summary['Ore Totali'] = (linea_summary['Minuti Totali'] / 60).round(1)
+    queue_days = minutes_to_days(
+        queue_minutes.reindex(linea_summary['Linea']).fillna(0).to_numpy(), working_hours_per_day
+    )
+    linea_summary['Giorni Coda'] = queue_days.round(1)
+    if reference_time is None:
+        reference_time = datetime.now()
+    linea_summary['Fine Coda Stimata'] = [
+        (reference_time + timedelta(days=days)).strftime('%d/%m/%Y') for days in queue_days
+    ]
+    return linea_summary
+
+
+def build_line_summary(df, queue_minutes, reference_time=None, working_hours_per_day=DEFAULT_WORKING_HOURS):
+    return line_summary_from_totals(line_totals(df), queue_minutes, reference_time, working_hours_per_day)
+
+
+def find_bottlenecks(linea_summary):
+    bottleneck_threshold = linea_summary['Ore Totali'].mean() * BOTTLENECK_FACTOR
+    bottlenecks = linea_summary[linea_summary['Ore Totali'] > bottleneck_threshold]
+    high_delay_linee = linea_summary[linea_summary['Ritardo Medio'] > HIGH_DELAY_DAYS]
+    return bottlenecks, high_delay_linee
+
+
+def client_totals(df, client_column='Cliente', minutes_column='min_prd'):
+    totals = df.groupby(client_column, observed=True).agg(**{
+        'N. Ordini': (minutes_column, 'size'),
+        'Minuti Totali': (minutes_column, 'sum'),
+    })
+    return _str_index(totals).rename_axis('Cliente').astype('float64')
+
+
+def client_summary_from_totals(totals, max_completion_days):
+    cliente_summary = pd.DataFrame({
+        'Cliente': totals.index.to_numpy(),
+        'N. Ordini': totals['N. Ordini'].to_numpy().astype('int64'),
+        'Minuti Totali': _whole_numbers(totals['Minuti Totali']),
+        'Giorni Max Completamento': max_completion_days.reindex(totals.index).to_numpy(),
+    })
+    return cliente_summary.sort_values('Giorni Max Completamento', ascending=False)
+
+
+def build_client_summary(delivery_df):
+    totals = client_totals(delivery_df, minutes_column='Minuti Produzione')
+    max_days = _str_index(delivery_df.groupby('Cliente', observed=True)['Giorni al Completamento'].max())
+    return client_summary_from_totals(totals, max_days)
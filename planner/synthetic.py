@@ -0,0 +1,126 @@
+"""Generatore di export di produzione sintetici nel layout posizionale atteso dall'app.
+
+Esempio: python -m planner.synthetic --rows 100000 --lines 40 -o sintetico_100k.xlsx
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from planner.export import create_excel_download
+from planner.ingestion import COLUMN_MAPPING, MIN_REQUIRED_COLUMNS
+
+PHASE_WEIGHTS = {"BIANCO": 0.35, "TINTO": 0.45, "FINISSAGGIO": 0.20}
+
+# Minuti per metro medi per fase, usati per ricavare M24_QT_SALDO da min_prd
+PHASE_MINUTES_PER_METRE = {"BIANCO": 0.004, "TINTO": 0.009, "FINISSAGGIO": 0.006}
+
+DELAY_DISTRIBUTIONS = ['normal', 'uniform', 'exponential']
+
+# Intestazioni come nell'export MES; le colonne non mappate hanno nomi generici
+MAPPED_HEADERS = {
+    1: 'M25_NR_CARTELLINO',
+    2: 'EW2_COD_CLIFOR',
+    3: 'Z01_CD_ART',
+    6: 'Linea',
+    7: 'Macro_Fase',
+    8: 'M24_QT_SALDO',
+    26: 'min_prd',
+    38: 'ritardo cartellino',
+}
+
+
+def _delays(rng, rows, distribution, delay_mean, delay_spread):
+    if distribution == 'normal':
+        values = rng.normal(delay_mean, delay_spread, rows)
+    elif distribution == 'uniform':
+        values = rng.uniform(delay_mean - delay_spread, delay_mean + delay_spread, rows)
+    elif distribution == 'exponential':
+        # Coda lunga di ordini molto in ritardo, il resto in anticipo di qualche giorno
+        values = rng.exponential(max(delay_spread, 1e-9), rows) + delay_mean - delay_spread
+    else:
+        raise ValueError(f"Distribuzione ritardi non supportata: {distribution}")
+    return np.round(values).astype('int64')
+
+
+def generate_production_frame(rows, lines=20, customers=200, articles=2000,
+                              delay_distribution='normal', delay_mean=3.0, delay_spread=6.0,
+                              extra_columns=1, seed=0):
+    rng = np.random.default_rng(seed)
+    phases = rng.choice(list(PHASE_WEIGHTS), rows, p=list(PHASE_WEIGHTS.values()))
+    min_prd = np.round(rng.lognormal(np.log(240), 0.8, rows))
+    minutes_per_metre = pd.Series(phases).map(PHASE_MINUTES_PER_METRE).to_numpy()
+    quantity = np.round(min_prd / minutes_per_metre * rng.uniform(0.8, 1.2, rows), 1)
+
+    mapped = {
+        1: np.arange(25_000_000, 25_000_000 + rows),
+        2: np.char.add('C', np.char.zfill(rng.integers(0, customers, rows).astype(str), 4)),
+        3: np.char.add('ART', np.char.zfill(rng.integers(0, articles, rows).astype(str), 5)),
+        6: np.char.add('L', np.char.zfill(rng.integers(0, lines, rows).astype(str), 2)),
+        7: phases,
+        8: quantity,
+        26: min_prd,
+        38: _delays(rng, rows, delay_distribution, delay_mean, delay_spread),
+    }
+    if set(mapped) != set(COLUMN_MAPPING) or set(MAPPED_HEADERS) != set(COLUMN_MAPPING):
+        # COLUMN_MAPPING modificato senza aggiornare il generatore: resterebbero colonne mappate vuote
+        missing = sorted(set(COLUMN_MAPPING) - (set(mapped) & set(MAPPED_HEADERS)))
+        extra = sorted((set(mapped) | set(MAPPED_HEADERS)) - set(COLUMN_MAPPING))
+        raise ValueError(
+            f"Generatore non allineato a COLUMN_MAPPING: posizioni mancanti {missing}, non mappate {extra}"
+        )
+
+    width = MIN_REQUIRED_COLUMNS + extra_columns
+    columns = {}
+    for position in range(width):
+        if position in mapped:
+            columns[MAPPED_HEADERS[position]] = mapped[position]
+        elif position == 37:
+            # Come nell'export reale il ritardo compare due volte; l'intestazione differisce
+            # solo per lo spazio finale, cosi' anche il parquet resta scrivibile
+            columns['ritardo cartellino '] = mapped[38]
+        else:
+            columns[f'COL_{position:02d}'] = rng.integers(0, 1000, rows)
+    return pd.DataFrame(columns)
+
+
+def write_production_file(df, path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        df.to_csv(path, index=False)
+    elif extension == '.parquet':
+        df.to_parquet(path, index=False)
+    else:
+        with open(path, 'wb') as handle:
+            handle.write(create_excel_download(df, 'Export').getbuffer())
+    return path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m planner.synthetic', description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', required=True, help="file di destinazione (.xlsx, .csv, .parquet)")
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--lines', type=int, default=20, help="numero di linee distinte")
+    parser.add_argument('--customers', type=int, default=200, help="numero di clienti distinti")
+    parser.add_argument('--articles', type=int, default=2000, help="numero di articoli distinti")
+    parser.add_argument('--delay-distribution', choices=DELAY_DISTRIBUTIONS, default='normal')
+    parser.add_argument('--delay-mean', type=float, default=3.0, help="ritardo medio (giorni)")
+    parser.add_argument('--delay-spread', type=float, default=6.0, help="dispersione del ritardo (giorni)")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    df = generate_production_frame(
+        args.rows, args.lines, args.customers, args.articles,
+        args.delay_distribution, args.delay_mean, args.delay_spread, seed=args.seed
+    )
+    write_production_file(df, args.output)
+    print(f"{args.rows:,} righe scritte in {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from planner.confidence import COMMITMENT_LABEL, CONFIDENCE_LABELS, completion_quantiles
+from planner.scheduling import DEFAULT_WORKING_HOURS, line_categories, minutes_to_days
+
+PHASES = ["BIANCO", "TINTO", "FINISSAGGIO"]
+
+# Resa usata quando lo storico non permette di stimare i minuti per metro di una fase
+METRI_GIORNO = 100000
+
+# Margine fisso usato solo senza simulazione di confidenza
+SAFETY_BUFFER = 0.20
+
+CANDIDATE_COLUMNS = ['Tipologia', 'Metri']
+OPTIONAL_CANDIDATE_COLUMNS = ['Riferimento', 'Linea', 'Ritardo']
+
+
+def _normalize_phase(values):
+    return pd.Series(values, dtype=object).astype(str).str.strip().str.upper()
+
+
+def build_whatif_profile(df, schedule):
+    lines = pd.Index(schedule['Linea'].unique())
+    codes = lines.get_indexer(schedule['Linea'])
+    rows = schedule['row'].to_numpy()
+    finish = schedule['finish_min'].to_numpy()
+
+    # La coda e' gia' ordinata per (linea, -ritardo): una chiave composta monotona permette
+    # di trovare il punto di inserimento di un nuovo ordine con una sola searchsorted
+    neg_delay = -df['ritardo_cartellino'].to_numpy(dtype='float64')[rows]
+    key_low = (neg_delay.min() if len(neg_delay) else 0.0) - 1
+    key_span = (neg_delay.max() if len(neg_delay) else 0.0) - key_low + 2
+    keys = codes * key_span + (neg_delay - key_low)
+
+    counts = np.bincount(codes, minlength=len(lines))
+    stops = np.cumsum(counts)
+    line_totals = pd.Series(finish[stops - 1] if len(finish) else [], index=lines, dtype='float64')
+
+    phases = _normalize_phase(df['Macro_Fase'].to_numpy())
+    min_prd = df['min_prd'].to_numpy(dtype='float64')
+    quantity = df['M24_QT_SALDO'].to_numpy(dtype='float64')
+    linee = line_categories(df).astype(str)
+
+    line_phase_minutes = pd.pivot_table(
+        pd.DataFrame({'Linea': linee, 'Fase': phases.to_numpy(), 'Minuti': min_prd}),
+        index='Linea', columns='Fase', values='Minuti', aggfunc='sum', fill_value=0
+    )
+
+    # Minuti per metro osservati per fase, solo sulle righe con quantita' valorizzata
+    with_quantity = quantity > 0
+    phase_totals = pd.DataFrame({
+        'Fase': phases.to_numpy()[with_quantity],
+        'min_prd': min_prd[with_quantity],
+        'qty': quantity[with_quantity],
+    }).groupby('Fase')[['min_prd', 'qty']].sum()
+    phase_rates = (phase_totals['min_prd'] / phase_totals['qty']).replace([np.inf, -np.inf], np.nan).dropna()
+
+    # Per ogni fase la linea piu' libera tra quelle che la lavorano oggi
+    best_line = {}
+    for phase in line_phase_minutes.columns:
+        phase_lines = line_phase_minutes.index[line_phase_minutes[phase] > 0]
+        if len(phase_lines) > 0:
+            best_line[phase] = line_totals.reindex(phase_lines).idxmin()
+
+    return {
+        'lines': lines,
+        'keys': keys,
+        'key_low': key_low,
+        'key_span': key_span,
+        'line_starts': stops - counts,
+        'finish_ext': np.concatenate([[0.0], finish]),
+        'line_totals': line_totals,
+        'line_phase_minutes': line_phase_minutes,
+        'phase_rates': phase_rates,
+        'best_line': best_line,
+        'fallback_line': line_totals.idxmin() if len(line_totals) else None,
+    }
+
+
+def minutes_per_metre(profile, phase):
+    default_rate = DEFAULT_WORKING_HOURS * 60 / METRI_GIORNO
+    return profile['phase_rates'].get(phase, default_rate)
+
+
+def phase_lines(profile, phase):
+    load = profile['line_phase_minutes']
+    if phase not in load.columns:
+        return list(profile['lines'])
+    return list(load.index[load[phase] > 0])
+
+
+def _locate(profile, codes, delays):
+    # Attesa = minuti gia' in coda davanti al nuovo ordine; a parita' di ritardo entra per ultimo
+    neg_delay = np.clip(-delays, profile['key_low'], profile['key_low'] + profile['key_span'] - 1)
+    keys = codes * profile['key_span'] + (neg_delay - profile['key_low'])
+    insert_at = np.searchsorted(profile['keys'], keys, side='right')
+    line_start = profile['line_starts'][codes]
+    wait = np.where(insert_at > line_start, profile['finish_ext'][insert_at], 0.0)
+    return wait, insert_at - line_start
+
+
+def quote_order(profile, tipologia, metri, linea=None, ritardo=0,
+                working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None, confidence=None):
+    phase = str(tipologia).strip().upper()
+    if linea is None:
+        linea = profile['best_line'].get(phase, profile['fallback_line'])
+    code = profile['lines'].get_loc(linea)
+    wait, ahead = _locate(profile, np.array([code]), np.array([float(ritardo)]))
+
+    own_minutes = metri * minutes_per_metre(profile, phase)
+    total_days = minutes_to_days(wait[0] + own_minutes, working_hours_per_day)
+    quantiles = None
+    if confidence is not None:
+        quantiles = completion_quantiles(confidence, linea, wait[0] + own_minutes)
+    if quantiles is None:
+        quantile_days = {label: None for label in CONFIDENCE_LABELS}
+        commitment_days = total_days * (1 + SAFETY_BUFFER)
+    else:
+        days = minutes_to_days(quantiles[0], working_hours_per_day)
+        quantile_days = {label: float(value) for label, value in zip(CONFIDENCE_LABELS, days)}
+        commitment_days = quantile_days[COMMITMENT_LABEL]
+    if reference_time is None:
+        reference_time = datetime.now()
+    return {
+        'linea': linea,
+        'ordini_davanti': int(ahead[0]),
+        'minuti_attesa': float(wait[0]),
+        'minuti_ordine': float(own_minutes),
+        'giorni_attesa': float(minutes_to_days(wait[0], working_hours_per_day)),
+        'giorni_ordine': float(minutes_to_days(own_minutes, working_hours_per_day)),
+        'giorni_totali': float(total_days),
+        'giorni_quantili': quantile_days,
+        'giorni_impegno': float(commitment_days),
+        'simulato': quantiles is not None,
+        'data_consegna': pd.Timestamp(reference_time) + pd.Timedelta(days=float(commitment_days)),
+    }
+
+
+def read_candidate_orders(file_bytes, file_name):
+    if file_name.lower().endswith('.csv'):
+        candidates = pd.read_csv(BytesIO(file_bytes), sep=None, engine='python')
+    else:
+        candidates = pd.read_excel(BytesIO(file_bytes))
+    candidates.columns = [str(col).strip().capitalize() for col in candidates.columns]
+
+    missing = [col for col in CANDIDATE_COLUMNS if col not in candidates.columns]
+    if missing:
+        return None, f"Colonne mancanti nel file ordini: {', '.join(missing)}"
+    keep = CANDIDATE_COLUMNS + [col for col in OPTIONAL_CANDIDATE_COLUMNS if col in candidates.columns]
+    return candidates[keep], "OK"
+
+
+def quote_orders(profile, candidates, working_hours_per_day=DEFAULT_WORKING_HOURS, reference_time=None,
+                 confidence=None):
+    # Ogni candidato e' quotato sul carico attuale, indipendentemente dagli altri del lotto
+    if reference_time is None:
+        reference_time = datetime.now()
+    n = len(candidates)
+    phases = _normalize_phase(candidates['Tipologia'].to_numpy())
+    metri = pd.to_numeric(candidates['Metri'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    if 'Ritardo' in candidates.columns:
+        delays = pd.to_numeric(candidates['Ritardo'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    else:
+        delays = np.zeros(n)
+
+    default_rate = DEFAULT_WORKING_HOURS * 60 / METRI_GIORNO
+    rates = phases.map(profile['phase_rates']).fillna(default_rate).to_numpy(dtype='float64')
+    lines = phases.map(profile['best_line']).fillna(profile['fallback_line'])
+    if 'Linea' in candidates.columns:
+        requested = candidates['Linea'].reset_index(drop=True)
+        has_request = requested.notna() & (requested.astype(str).str.strip() != '')
+        lines = lines.where(~has_request, requested.astype(str).str.strip())
+
+    codes = profile['lines'].get_indexer(lines.astype(str))
+    valid = codes >= 0
+    wait = np.full(n, np.nan)
+    ahead = np.full(n, -1)
+    if valid.any():
+        wait[valid], ahead[valid] = _locate(profile, codes[valid], delays[valid])
+
+    own_minutes = metri * rates
+    total_days = minutes_to_days(wait + own_minutes, working_hours_per_day)
+    if confidence is None:
+        commitment_days = total_days * (1 + SAFETY_BUFFER)
+        quantile_days = None
+    else:
+        # Quantili letti dalle curve simulate della linea assegnata, una linea alla volta
+        quantile_days = np.full((n, len(CONFIDENCE_LABELS)), np.nan)
+        line_names = lines.to_numpy()
+        for linea in pd.unique(line_names[valid]):
+            on_line = valid & (line_names == linea)
+            quantiles = completion_quantiles(confidence, linea, (wait + own_minutes)[on_line])
+            if quantiles is not None:
+                quantile_days[on_line] = minutes_to_days(quantiles, working_hours_per_day)
+        commitment_days = quantile_days[:, CONFIDENCE_LABELS.index(COMMITMENT_LABEL)]
+    delivery = pd.Timestamp(reference_time) + pd.to_timedelta(commitment_days, unit='D')
+
+    quotes = pd.DataFrame({
+        'Tipologia': phases.to_numpy(),
+        'Metri': metri,
+        'Linea': lines.to_numpy(),
+        'Ritardo': delays,
+        'Ordini Davanti': ahead,
+        'Giorni Attesa Coda': minutes_to_days(wait, working_hours_per_day).round(1),
+        'Giorni Lavorazione': minutes_to_days(own_minutes, working_hours_per_day).round(1),
+        'Giorni con Buffer': commitment_days.round(1),
+        'Data Consegna Stimata': pd.Series(delivery).dt.strftime('%d/%m/%Y').to_numpy(),
+        'Esito': np.where(valid, "OK", "Linea non trovata"),
+    })
+    if quantile_days is not None:
+        quotes = quotes.drop(columns='Giorni con Buffer')
+        for level, label in enumerate(CONFIDENCE_LABELS):
+            quotes.insert(quotes.columns.get_loc('Data Consegna Stimata'), f"Giorni {label}", quantile_days[:, level].round(1))
+    if 'Riferimento' in candidates.columns:
+        quotes.insert(0, 'Riferimento', candidates['Riferimento'].to_numpy())
+    return quotes
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from planner.priority import get_priority_statuses
+from planner.scheduling import line_categories, priority_order
+
+WORK_ORDER_COLUMNS = [
+    'Linea', 'ID', 'Cliente', 'Articolo', 'Fase',
+    'Minuti Produzione', 'Ritardo (giorni)', 'Priorità'
+]
+
+# Righe di dettaglio serializzate per pagina nella vista compatta
+WORK_ORDER_PAGE_SIZE = 200
+
+
+def build_work_orders(df, order=None):
+    # Un solo ordinamento stabile per (Linea, ritardo decrescente), condiviso con lo scheduler;
+    # in alternativa la sequenza ottimizzata, con le linee nello stesso ordine
+    if order is None:
+        linee, order = priority_order(df)
+    else:
+        linee = line_categories(df)
+    codes = linee.codes
+    delay = df['ritardo_cartellino'].to_numpy()
+
+    work_orders_df = pd.DataFrame({
+        'Linea': linee.categories.take(codes[order]),
+        'ID': df['ID_Cartellino'].array.take(order),
+        'Cliente': df['Cliente'].array.take(order),
+        'Articolo': df['Articolo'].array.take(order),
+        'Fase': df['Macro_Fase'].array.take(order),
+        'Minuti Produzione': df['min_prd'].array.take(order),
+        'Ritardo (giorni)': delay[order],
+        'Priorità': get_priority_statuses(delay[order]),
+    }, columns=WORK_ORDER_COLUMNS)
+
+    # Le righe di ogni linea sono contigue: bastano gli offset cumulati dei conteggi
+    counts = np.bincount(codes, minlength=len(linee.categories))
+    stops = np.cumsum(counts)
+    starts = stops - counts
+    line_slices = [
+        (str(linea), int(start), int(stop))
+        for linea, start, stop in zip(linee.categories, starts, stops)
+        if stop > start
+    ]
+    return work_orders_df, line_slices
+
+
+def line_display_frame(work_orders_df, start, stop):
+    return work_orders_df.iloc[start:stop, 1:]
+
+
+def line_overview(work_orders_df, line_slices):
+    # Un valore per linea dagli offset contigui: nessun groupby sulle righe
+    starts = np.array([start for _, start, _ in line_slices], dtype='int64')
+    stops = np.array([stop for _, _, stop in line_slices], dtype='int64')
+    minutes = work_orders_df['Minuti Produzione'].to_numpy(dtype='float64')
+    total_minutes = np.add.reduceat(minutes, starts) if len(starts) else np.array([])
+    delays = work_orders_df['Ritardo (giorni)'].to_numpy()
+    # Con la sequenza ottimizzata il peggiore non e' necessariamente la prima riga della linea
+    max_delays = np.fmax.reduceat(delays, starts) if len(starts) else np.array([], dtype=delays.dtype)
+    return pd.DataFrame({
+        'Linea': [linea for linea, _, _ in line_slices],
+        'N. Ordini': stops - starts,
+        'Minuti Totali': total_minutes,
+        'Ritardo Massimo': max_delays,
+        'Priorità': get_priority_statuses(max_delays) if len(starts) else [],
+    })
+
+
+def page_bounds(start, stop, page, page_size=WORK_ORDER_PAGE_SIZE):
+    n_pages = max(1, -(-(stop - start) // page_size))
+    page = min(max(page, 1), n_pages)
+    page_start = start + (page - 1) * page_size
+    return page_start, min(page_start + page_size, stop), n_pages
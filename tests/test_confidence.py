@@ -0,0 +1,95 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from planner import confidence
+from planner.ingestion import process_dataframe_by_position
+from planner.scheduling import build_line_schedule
+from planner.synthetic import generate_production_frame
+
+SCENARIOS = 20_000
+
+
+def _brute_force(df, schedule, rng):
+    # Ogni ordine simulato singolarmente, senza punti di controllo ne' tabelle di quantili
+    rows = schedule['row'].to_numpy()
+    linee = schedule['Linea'].astype(str).to_numpy()
+    clients = df['Cliente'].astype(str).to_numpy()[rows]
+    minutes = np.clip(schedule['finish_min'].to_numpy() - schedule['start_min'].to_numpy(), 0, None)
+    order_minutes = np.zeros((len(schedule), len(confidence.CONFIDENCE_LEVELS)))
+    client_paths = {}
+    processing_sigma2 = np.log1p(confidence.PROCESSING_CV ** 2)
+    factor_mu, factor_sigma = confidence._lognormal_params(1.0, confidence.LINE_FACTOR_CV)
+    for linea in np.unique(linee):
+        index = np.flatnonzero(linee == linea)
+        line_minutes = minutes[index]
+        noise = np.exp(np.sqrt(processing_sigma2) * rng.standard_normal((len(index), SCENARIOS)) - processing_sigma2 / 2)
+        path = np.cumsum(noise * line_minutes[:, None], axis=0)
+        path *= np.exp(factor_mu + factor_sigma * rng.standard_normal(SCENARIOS))
+
+        total = line_minutes.sum()
+        counts = rng.poisson(confidence.STOPPAGES_PER_WORK_HOUR / 60 * total, SCENARIOS)
+        scenario = np.repeat(np.arange(SCENARIOS), counts)
+        at_order = np.searchsorted(np.cumsum(line_minutes), rng.random(counts.sum()) * total)
+        lost = np.zeros((len(index), SCENARIOS))
+        np.add.at(lost, (at_order, scenario), rng.exponential(confidence.STOPPAGE_MEAN_HOURS * 60, counts.sum()))
+        path += np.cumsum(lost, axis=0)
+
+        order_minutes[index] = np.quantile(path, confidence.CONFIDENCE_LEVELS, axis=1).T
+        for client in np.unique(clients[index]):
+            last = np.flatnonzero(clients[index] == client)[-1]
+            client_paths[client] = np.maximum(client_paths.get(client, 0), path[last])
+
+    by_row = np.empty_like(order_minutes)
+    by_row[rows] = order_minutes
+    client_minutes = pd.DataFrame(
+        {client: np.quantile(path, confidence.CONFIDENCE_LEVELS) for client, path in client_paths.items()}
+    ).T
+    return by_row, client_minutes
+
+
+def test_quantiles_match_brute_force_simulation():
+    df, _ = process_dataframe_by_position(generate_production_frame(1500, lines=5, customers=40, seed=3))
+    schedule = build_line_schedule(df)
+    model = confidence.simulate_completion(df, schedule, scenarios=SCENARIOS)
+    expected_orders, expected_clients = _brute_force(df, schedule, np.random.default_rng(9))
+
+    order_error = np.abs(model['order_minutes'] / np.maximum(expected_orders, 1) - 1)
+    assert np.quantile(order_error, 0.95, axis=0).max() < 0.02
+
+    clients = pd.DataFrame(model['client_minutes'], index=model['client_names']).loc[expected_clients.index]
+    client_error = np.abs(clients.to_numpy() / expected_clients.to_numpy() - 1)
+    assert client_error.max() < 0.02
+    # P50 <= P80 <= P95 per ogni ordine e cliente
+    assert (np.diff(model['order_minutes'], axis=1) >= 0).all()
+    assert (np.diff(model['client_minutes'], axis=1) >= 0).all()
+
+
+def test_working_hours_only_convert_to_days():
+    df, _ = process_dataframe_by_position(generate_production_frame(500, lines=3, seed=1))
+    model = confidence.simulate_completion(df, build_line_schedule(df), scenarios=2_000)
+    eight = confidence.order_confidence(model, 8)['Giorni P80'].to_numpy()
+    four = confidence.order_confidence(model, 4)['Giorni P80'].to_numpy()
+    assert four == pytest.approx(2 * eight, abs=0.11)
+
+
+def _snapshot(seed, shrink):
+    df, _ = process_dataframe_by_position(generate_production_frame(400, lines=3, seed=seed))
+    df['min_prd'] = df['min_prd'].to_numpy(dtype='float64') * shrink
+    return df
+
+
+def test_line_factors_pair_snapshots_within_source():
+    plant_a, plant_b = _snapshot(1, 1.0), _snapshot(2, 1.0)
+    snapshots = [
+        ('A', date(2026, 10, 1), plant_a),
+        ('B', date(2026, 10, 2), plant_b),
+        ('A', date(2026, 10, 3), _snapshot(1, 0.5)),
+    ]
+    fitted = confidence.fit_line_factors(snapshots, 8)
+    # Una sola coppia (A, A): meta' dei minuti di ogni linea smaltiti in due giorni
+    produced = plant_a.groupby('Linea', observed=True)['min_prd'].sum().to_numpy() / 2
+    assert fitted['Osservazioni'].tolist() == [1] * len(produced)
+    assert fitted['Fattore Medio'].to_numpy() == pytest.approx(np.clip(2 * 8 * 60 / produced, *confidence.FIT_FACTOR_RANGE))
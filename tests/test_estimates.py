@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from planner.estimates import build_delivery_estimates
+from planner.ingestion import process_dataframe_by_position
+from planner.priority import get_priority_status
+from planner.synthetic import generate_production_frame
+
+REFERENCE_TIME = datetime(2026, 3, 1, 23, 59, 30)
+# Colonne che il modello a coda per linea non ha cambiato rispetto alla versione originale
+UNCHANGED_COLUMNS = ['ID', 'Cliente', 'Articolo', 'Linea', 'Minuti Produzione', 'Ritardo Attuale', 'Priorità']
+
+
+def calculate_completion_date(min_prd, delay, working_hours_per_day, reference_time):
+    # Copia della funzione originale, con l'orologio fissato invece di datetime.now()
+    days_needed = min_prd / (working_hours_per_day * 60)
+    total_days = days_needed + max(0, delay)
+    completion_date = reference_time + timedelta(days=total_days)
+    return completion_date
+
+
+def baseline_delivery_estimates(df, working_hours_per_day, reference_time):
+    # Ciclo iterrows della scheda consegne originale: ogni ordine da solo, ritardo sommato
+    delivery_data = []
+    for _, row in df.iterrows():
+        completion_date = calculate_completion_date(
+            row['min_prd'], row['ritardo_cartellino'], working_hours_per_day, reference_time
+        )
+        delivery_data.append({
+            'ID': row['ID_Cartellino'],
+            'Cliente': row['Cliente'],
+            'Articolo': row['Articolo'],
+            'Linea': row['Linea'],
+            'Minuti Produzione': row['min_prd'],
+            'Ritardo Attuale': row['ritardo_cartellino'],
+            'Data Completamento Stimata': completion_date.strftime('%d/%m/%Y'),
+            'Giorni al Completamento': (completion_date - reference_time).days,
+            'Priorità': get_priority_status(row['ritardo_cartellino']),
+        })
+    delivery_df = pd.DataFrame(delivery_data)
+    return delivery_df.sort_values('Giorni al Completamento', ascending=False)
+
+
+def legacy_delivery_estimates(df, working_hours_per_day, reference_time):
+    # Lo stesso ciclo per riga riscritto per la coda per linea: gli ordini di una linea
+    # in ordine alfabetico di linea e ritardo decrescente, ognuno finisce dopo i precedenti
+    queued = df.assign(_row=np.arange(len(df)), _linea=df['Linea'].astype(str))
+    queued = queued.sort_values(['_linea', 'ritardo_cartellino'], ascending=[True, False], kind='stable')
+    line_minutes = {}
+    positions = {}
+    data = {}
+    for _, row in queued.iterrows():
+        minutes = max(float(row['min_prd']), 0.0)
+        start_minutes = line_minutes.get(row['_linea'], 0.0)
+        line_minutes[row['_linea']] = start_minutes + minutes
+        positions[row['_linea']] = positions.get(row['_linea'], 0) + 1
+        start = reference_time + timedelta(days=start_minutes / (working_hours_per_day * 60))
+        completion = reference_time + timedelta(days=line_minutes[row['_linea']] / (working_hours_per_day * 60))
+        data[row['_row']] = {
+            'ID': row['ID_Cartellino'],
+            'Cliente': row['Cliente'],
+            'Articolo': row['Articolo'],
+            'Linea': row['Linea'],
+            'Minuti Produzione': row['min_prd'],
+            'Ritardo Attuale': row['ritardo_cartellino'],
+            'Posizione in Coda': positions[row['_linea']],
+            'Data Inizio Stimata': start.strftime('%d/%m/%Y'),
+            'Data Completamento Stimata': completion.strftime('%d/%m/%Y'),
+            'Giorni al Completamento': (completion - reference_time).days,
+            'Priorità': get_priority_status(row['ritardo_cartellino']),
+        }
+    legacy = pd.DataFrame([data[row] for row in range(len(df))])
+    return legacy.sort_values('Giorni al Completamento', ascending=False)
+
+
+@pytest.fixture(scope='module')
+def production_df():
+    df, _ = process_dataframe_by_position(generate_production_frame(2000, lines=12, seed=7))
+    # Minuti frazionari e ritardi esattamente sulle soglie di priorita'
+    df['min_prd'] = df['min_prd'].astype('float64')
+    df['ritardo_cartellino'] = df['ritardo_cartellino'].astype('float64')
+    df.loc[:50, 'min_prd'] = np.linspace(0, 1000, 51) + 0.3333
+    df.loc[51:60, 'ritardo_cartellino'] = [0, 5, 5.0001, 10, 10.5, -3, 11, 0.2, 6, 1]
+    return df
+
+
+@pytest.mark.parametrize('working_hours', [4, 8, 12])
+def test_matches_row_by_row_loop(production_df, working_hours):
+    expected = legacy_delivery_estimates(production_df, working_hours, REFERENCE_TIME)
+    result = build_delivery_estimates(production_df, working_hours, REFERENCE_TIME)
+    # Le colonne compattate (categorie, interi ridotti) hanno solo un dtype diverso dal ciclo
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize('working_hours', [4, 8, 12])
+def test_unchanged_columns_match_original_loop(production_df, working_hours):
+    expected = baseline_delivery_estimates(production_df, working_hours, REFERENCE_TIME).sort_index()
+    result = build_delivery_estimates(production_df, working_hours, REFERENCE_TIME).sort_index()
+    pd.testing.assert_frame_equal(
+        result[UNCHANGED_COLUMNS], expected[UNCHANGED_COLUMNS], check_dtype=False, check_categorical=False
+    )
+
+
+@pytest.mark.parametrize('working_hours', [4, 8, 12])
+def test_queue_heads_match_original_dates(production_df, working_hours):
+    # Divergenza voluta: con la coda per linea un ordine finisce dopo quelli che lo precedono
+    # e il ritardo non si somma piu' alla durata. Il primo ordine di ogni linea, senza ritardo
+    # e con minuti non negativi, deve pero' avere la stessa data della versione originale
+    df = production_df.assign(ritardo_cartellino=np.minimum(production_df['ritardo_cartellino'], 0))
+    expected = baseline_delivery_estimates(df, working_hours, REFERENCE_TIME).sort_index()
+    result = build_delivery_estimates(df, working_hours, REFERENCE_TIME).sort_index()
+
+    heads = (result['Posizione in Coda'] == 1) & (df['min_prd'] >= 0).to_numpy()
+    assert heads.sum() == df['Linea'].nunique()
+    columns = ['Data Completamento Stimata', 'Giorni al Completamento']
+    pd.testing.assert_frame_equal(result.loc[heads, columns], expected.loc[heads, columns], check_dtype=False)
+    # Tutti gli altri ordini finiscono non prima della propria durata da soli
+    assert (result['Giorni al Completamento'] >= expected['Giorni al Completamento'].clip(lower=0)).all()
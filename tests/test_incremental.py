@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from planner.estimates import build_delivery_estimates
+from planner.incremental import (
+    apply_delta,
+    build_incremental_state,
+    current_frame,
+    delta_deletions,
+    incremental_client_summary,
+    incremental_delivery_estimates,
+    incremental_line_summary,
+)
+from planner.ingestion import process_dataframe_by_position
+from planner.scheduling import build_line_schedule, line_loads
+from planner.summaries import build_client_summary, build_line_summary
+from planner.synthetic import generate_production_frame
+
+REFERENCE_TIME = datetime(2026, 1, 1)
+
+
+def _comparable(frame, key):
+    # Chiavi e etichette come testo; i numeri restano numeri (le somme per differenza
+    # possono scostarsi nell'ultima cifra)
+    frame = frame.copy()
+    for col in frame.columns:
+        if not pd.api.types.is_numeric_dtype(frame[col]):
+            frame[col] = frame[col].astype(str)
+    return frame.sort_values(key, kind='stable').reset_index(drop=True)
+
+
+def _full_recompute(df, delta):
+    # Stesso risultato atteso ricostruendo il file completo e ricalcolando tutto
+    keys = df['ID_Cartellino'].astype(str)
+    delta_keys = delta['ID_Cartellino'].astype(str)
+    kept = df[~keys.isin(delta_keys).to_numpy()]
+    merged = pd.concat([kept, delta[~delta_deletions(delta)]], ignore_index=True)
+    merged['Linea'] = pd.Categorical(merged['Linea'].astype(str))
+    schedule = build_line_schedule(merged)
+    line_summary = build_line_summary(merged, line_loads(schedule), REFERENCE_TIME)
+    estimates = build_delivery_estimates(merged, 8, REFERENCE_TIME, schedule)
+    return line_summary, build_client_summary(estimates), estimates
+
+
+@pytest.fixture
+def frames():
+    df, _ = process_dataframe_by_position(generate_production_frame(5000, lines=12, seed=3))
+    delta, _ = process_dataframe_by_position(generate_production_frame(300, lines=14, seed=9))
+    rng = np.random.default_rng(1)
+    # 200 cartellini esistenti (aggiornati o chiusi) e 100 nuovi, anche su linee nuove
+    delta['ID_Cartellino'] = np.r_[
+        rng.choice(df['ID_Cartellino'].to_numpy(), 200, replace=False), np.arange(10**9, 10**9 + 100)
+    ]
+    delta.loc[150:249, ['min_prd', 'M24_QT_SALDO']] = 0
+    return df, delta
+
+
+def test_delta_matches_full_recompute(frames):
+    df, delta = frames
+    state = build_incremental_state(df, 8, REFERENCE_TIME)
+    report = apply_delta(state, delta)
+    assert (report['inserted'], report['updated'], report['deleted']) == (50, 150, 50)
+
+    line_summary, client_summary, estimates = _full_recompute(df, delta)
+    for incremental, full, key in [
+        (incremental_line_summary(state), line_summary, 'Linea'),
+        (incremental_client_summary(state), client_summary, 'Cliente'),
+        (incremental_delivery_estimates(state), estimates, 'ID'),
+    ]:
+        pd.testing.assert_frame_equal(_comparable(incremental, key), _comparable(full, key), check_dtype=False)
+
+
+def test_delta_closing_every_order(frames):
+    df, _ = frames
+    state = build_incremental_state(df, 8, REFERENCE_TIME)
+    closing = df.assign(min_prd=0, M24_QT_SALDO=0)
+    assert apply_delta(state, closing)['deleted'] == len(df)
+    assert len(incremental_line_summary(state)) == 0
+    assert len(incremental_client_summary(state)) == 0
+    assert list(current_frame(state).columns) == list(df.columns)
+
+
+def test_negative_minutes_do_not_shorten_the_queue(frames):
+    df, delta = frames
+    # Rettifiche con minuti negativi: nel piano completo non occupano la linea ma non la accorciano
+    df = df.copy()
+    delta = delta.copy()
+    df.loc[:19, 'min_prd'] = -300
+    delta.loc[[0, 1, 250, 251], 'min_prd'] = -300
+    state = build_incremental_state(df, 8, REFERENCE_TIME)
+    apply_delta(state, delta)
+
+    line_summary, _, _ = _full_recompute(df, delta)
+    pd.testing.assert_frame_equal(
+        _comparable(incremental_line_summary(state), 'Linea'), _comparable(line_summary, 'Linea'), check_dtype=False
+    )
@@ -0,0 +1,62 @@
+import itertools
+import time
+
+import numpy as np
+import pytest
+
+from planner.ingestion import process_dataframe_by_position
+from planner.scheduling import build_line_schedule, schedule_by_row
+from planner.sequencing import _best_insertion, optimize_line, optimize_sequence, sequence_tardiness
+from planner.synthetic import generate_production_frame
+
+
+def _random_line(rng, n):
+    minutes = rng.integers(1, 500, n).astype('float64')
+    due = rng.normal(500, 800, n)
+    weights = rng.integers(1, 4, n).astype('float64')
+    return minutes, due, weights
+
+
+def test_insertion_deltas_match_full_recompute():
+    rng = np.random.default_rng(0)
+    minutes, due, weights = _random_line(rng, 30)
+    sequence = rng.permutation(30)
+    before = sequence_tardiness(minutes, due, weights, sequence)
+    for position in range(30):
+        target, delta = _best_insertion(minutes, due, weights, sequence, position)
+        moved = np.insert(np.delete(sequence, position), target, sequence[position])
+        assert sequence_tardiness(minutes, due, weights, moved) - before == pytest.approx(delta, abs=1e-6)
+
+
+def test_small_lines_against_brute_force():
+    rng = np.random.default_rng(1)
+    optimal = 0
+    cases = 150
+    for _ in range(cases):
+        n = int(rng.integers(2, 7))
+        minutes, due, weights = _random_line(rng, n)
+        result = optimize_line(minutes, due, weights, time.perf_counter() + 1)
+        best = min(
+            sequence_tardiness(minutes, due, weights, np.array(permutation))
+            for permutation in itertools.permutations(range(n))
+        )
+        assert sorted(result['sequence']) == list(range(n))
+        assert result['optimized'] <= result['current'] + 1e-6
+        assert result['optimized'] >= best - 1e-6
+        optimal += result['optimized'] <= best + 1e-6
+    # Ricerca locale: non sempre l'ottimo, ma quasi sempre su istanze piccole
+    assert optimal >= 0.95 * cases
+
+
+def test_optimized_order_is_a_valid_line_schedule():
+    df, _ = process_dataframe_by_position(generate_production_frame(3000, lines=8, seed=2))
+    result = optimize_sequence(df, time_budget=1.0, max_workers=1)
+    order = result['order']
+    assert sorted(order) == list(range(len(df)))
+
+    schedule = build_line_schedule(df, order)
+    finish_days = schedule_by_row(schedule, 'finish_min') / (8 * 60)
+    # Il ritardo riportato e' quello della coda che ne risulta
+    tardiness = np.maximum(finish_days + df['ritardo_cartellino'].to_numpy(dtype='float64'), 0).sum()
+    assert tardiness == pytest.approx(result['optimized_tardiness'], abs=0.05 * len(result['lines']))
+    assert result['optimized_tardiness'] <= result['current_tardiness']
@@ -0,0 +1,31 @@
+from datetime import date
+
+from planner import snapshots
+from planner.ingestion import PLANT_COLUMN, process_dataframe_by_position
+from planner.synthetic import generate_production_frame
+
+
+def _frame(seed, plant):
+    df, _ = process_dataframe_by_position(generate_production_frame(50, lines=2, seed=seed))
+    df[PLANT_COLUMN] = plant
+    return df
+
+
+def test_prune_keeps_latest_of_each_day_per_source(tmp_path):
+    saved = {}
+    for seed, plant, day in [
+        (1, 'A', date(2026, 10, 1)),
+        (2, 'A', date(2026, 10, 1)),
+        (3, 'A', date(2026, 10, 2)),
+        (4, 'A', date(2026, 10, 3)),
+        (5, 'B', date(2026, 10, 1)),
+    ]:
+        saved[seed] = snapshots.save_snapshot(_frame(seed, plant), str(seed) * 64, f"{plant}.xlsx", day, str(tmp_path))
+
+    removed = snapshots.prune_snapshots(keep_days=2, store_dir=str(tmp_path))
+
+    # A: il primo del 1/10 e' superato dal secondo, e il 1/10 esce dagli ultimi due giorni.
+    # B ha un solo giorno e resta
+    assert sorted(removed) == sorted([saved[1], saved[2]])
+    assert sorted(snapshots.list_snapshots(str(tmp_path))['Percorso']) == sorted([saved[3], saved[4], saved[5]])
+    assert snapshots.prune_snapshots(keep_days=0, store_dir=str(tmp_path)) == []